@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Theatre, Screen, Seat, Show, ShowSeat, Booking
+from .models import Theatre, Screen, Seat, Show, ShowSeat, Booking, PaymentEvent, OutboundEmail, DailySales, DailyMovieSales, DailyTheatreSales
 
 admin.site.register(Theatre)
 admin.site.register(Screen)
@@ -7,3 +7,8 @@ admin.site.register(Seat)
 admin.site.register(Show)
 admin.site.register(ShowSeat)
 admin.site.register(Booking)
+admin.site.register(PaymentEvent)
+admin.site.register(OutboundEmail)
+admin.site.register(DailySales)
+admin.site.register(DailyMovieSales)
+admin.site.register(DailyTheatreSales)
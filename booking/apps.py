@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class BookingConfig(AppConfig):
     name = 'booking'
+
+    def ready(self):
+        from bookmyseat.cache import invalidate_on_change
+        from . import expiry  # registers its system check
+
+        for model in ('Show', 'Screen', 'Theatre'):
+            invalidate_on_change(self.get_model(model), 'showtimes')
+        for model in ('Seat', 'Screen'):
+            invalidate_on_change(self.get_model(model), 'layouts')
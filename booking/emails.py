@@ -0,0 +1,63 @@
+"""
+Transactional email messages.
+
+Builders return unsent messages; delivery goes through the outbox in
+``booking.outbox`` so the request path never waits on the mail server.
+Bodies are rendered from ``templates/booking/email/``, which the cached
+template loader compiles once per process.
+"""
+from email.mime.image import MIMEImage
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Prefetch
+from django.template.loader import get_template
+
+from .models import Booking, ShowSeat
+from .tickets import ensure_ticket_image
+
+
+def confirmation_bookings():
+    """Bookings with everything the confirmation email reads, in one round trip per relation."""
+    return Booking.objects.select_related(
+        'user', 'show__movie', 'show__screen__theatre'
+    ).prefetch_related(
+        Prefetch('seats', queryset=ShowSeat.objects.order_by('row', 'number'))
+    )
+
+
+def booking_confirmation_context(booking):
+    show = booking.show
+    theatre = show.screen.theatre
+    # Sorting here keeps the prefetched order without a second query.
+    seats = sorted(booking.seats.all(), key=lambda s: (s.row, s.number))
+    return {
+        'booking': booking,
+        'show': show,
+        'movie_name': show.movie.name or "Movie",
+        'theatre_name': theatre.name or "Theatre",
+        'city': theatre.city or "",
+        'seats': seats,
+        'seats_display': ", ".join(f"{s.row}{s.number}" for s in seats),
+    }
+
+
+def build_booking_confirmation(booking):
+    context = booking_confirmation_context(booking)
+    context['qr_cid'] = f"ticket-{booking.ticket_reference}"
+
+    msg = EmailMultiAlternatives(
+        f"Booking Confirmed - {context['movie_name']} | BookMySeat",
+        get_template('booking/email/confirmation.txt').render(context),
+        settings.DEFAULT_FROM_EMAIL,
+        [booking.user.email]
+    )
+    msg.attach_alternative(get_template('booking/email/confirmation.html').render(context), "text/html")
+
+    # Inline parts referenced by cid: need a multipart/related container.
+    msg.mixed_subtype = 'related'
+    qr = MIMEImage(ensure_ticket_image(booking), 'png')
+    qr.add_header('Content-ID', f"<{context['qr_cid']}>")
+    qr.add_header('Content-Disposition', 'inline', filename=f"{booking.ticket_reference}.png")
+    msg.attach(qr)
+    return msg
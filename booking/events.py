@@ -0,0 +1,195 @@
+"""
+Fan-out of seat state changes to server-sent event streams.
+
+Seat transitions publish through ``publish_seat_changes`` once their
+transaction commits. The broker is chosen by ``SEAT_EVENTS_BROKER``:
+``LocalBroker`` fans out inside one process (and is what the tests use),
+``RedisBroker`` relays through Redis pub/sub so every worker's streams
+see changes made by any other worker. When its Redis connection drops,
+the streams it feeds are ended (clients reconnect, or poll, and resync)
+and it resubscribes with backoff.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, broker, show_id, queue, loop):
+        self.broker = broker
+        self.show_id = show_id
+        self.queue = queue
+        self.loop = loop
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, show_id):
+        # Must be called from the event loop that will consume the queue.
+        subscription = Subscription(
+            self, show_id, asyncio.Queue(self.queue_size), asyncio.get_running_loop()
+        )
+        with self._lock:
+            self._subscribers.setdefault(show_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.show_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.show_id]
+
+    def has_subscribers(self, show_id):
+        return show_id in self._subscribers
+
+    def publish(self, show_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(show_id, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(self._offer, subscription.queue, event)
+
+    def close_subscriptions(self):
+        """End every stream; each one gets ``None`` instead of its next event."""
+        with self._lock:
+            subscribers = [s for show_subscribers in self._subscribers.values() for s in show_subscribers]
+            self._subscribers.clear()
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(self._end, subscription.queue)
+
+    @staticmethod
+    def _offer(queue, event):
+        # A slow client misses events rather than growing the queue; it
+        # notices the version gap and resyncs from the seat-map endpoint.
+        if not queue.full():
+            queue.put_nowait(event)
+
+    @staticmethod
+    def _end(queue):
+        while queue.full():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+class RedisBroker(LocalBroker):
+    reconnect_min_seconds = 1
+    reconnect_max_seconds = 30
+
+    def __init__(self, url=None, channel_prefix='bookmyseat:seats:', **kwargs):
+        import redis
+
+        super().__init__(**kwargs)
+        self.channel_prefix = channel_prefix
+        self._redis = redis.Redis.from_url(url or settings.SEAT_EVENTS_REDIS_URL)
+        self._listener = None
+
+    def has_subscribers(self, show_id):
+        # Subscribers may be attached to any worker.
+        return True
+
+    def publish(self, show_id, event):
+        self._redis.publish(f"{self.channel_prefix}{show_id}", json.dumps(event))
+
+    def subscribe(self, show_id):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+        return super().subscribe(show_id)
+
+    def _listen(self):
+        delay = self.reconnect_min_seconds
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(f"{self.channel_prefix}*")
+                delay = self.reconnect_min_seconds
+                for message in pubsub.listen():
+                    self._relay(message)
+            except Exception as e:
+                logger.error(f"Seat event listener lost Redis, resubscribing in {delay}s: {e}")
+            finally:
+                pubsub.close()
+            # Events published meanwhile are lost; ending the streams makes
+            # their clients reconnect and resync from the seat map.
+            self.close_subscriptions()
+            time.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_seconds)
+
+    def _relay(self, message):
+        try:
+            show_id = int(message['channel'].decode().rsplit(':', 1)[-1])
+            LocalBroker.publish(self, show_id, json.loads(message['data']))
+        except (ValueError, KeyError) as e:
+            logger.error(f"Dropping malformed seat event: {e}")
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(
+                    getattr(settings, 'SEAT_EVENTS_BROKER', 'booking.events.LocalBroker')
+                )
+                _broker = broker_class(**getattr(settings, 'SEAT_EVENTS_OPTIONS', {}))
+    return _broker
+
+
+def publish_seat_changes(show_id, seat_ids):
+    if not getattr(settings, 'SEAT_EVENTS_ENABLED', False):
+        return
+    broker = get_broker()
+    if not broker.has_subscribers(show_id):
+        return
+
+    try:
+        _publish(broker, show_id, seat_ids)
+    except Exception as e:
+        # Streams are best effort; clients resync from the seat-map endpoint.
+        logger.error(f"Publishing seat changes for show {show_id} failed: {e}")
+
+
+def _publish(broker, show_id, seat_ids):
+    from .models import ShowSeat
+    from .seatmap import HOLD_SECONDS
+
+    seats = ShowSeat.objects.filter(show_id=show_id, id__in=seat_ids).values_list(
+        'id', 'is_booked', 'reserved_by_id', 'reserved_at', 'version'
+    )
+    changes = []
+    version = 0
+    for seat_id, is_booked, holder_id, reserved_at, seat_version in seats:
+        version = max(version, seat_version)
+        if is_booked:
+            changes.append([seat_id, 'booked', None, None])
+        elif holder_id and reserved_at:
+            changes.append([seat_id, 'held', int(reserved_at.timestamp() + HOLD_SECONDS), holder_id])
+        else:
+            changes.append([seat_id, 'available', None, None])
+
+    if changes:
+        broker.publish(show_id, {'v': version, 'changes': changes})
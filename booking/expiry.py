@@ -0,0 +1,276 @@
+"""
+Release lapsed seat holds as they expire.
+
+A lapsed hold still counts as held in the show counters until it is
+released. ``HoldExpiryScheduler`` keeps every hold's expiry in a
+hierarchical ``TimerWheel`` and, once a tick, releases whatever fell due
+with one guarded UPDATE per show, so a re-claimed seat is left alone.
+
+Holds placed in this process are scheduled on commit; holds placed by
+other workers are picked up by polling the hold index, and the wheel is
+rebuilt from the database whenever a scheduler takes the lead. Only the
+worker holding the leader lease in the default cache releases anything.
+That is only exclusive when the cache is shared between workers; with a
+per-process cache (the local-memory default) every worker leads, which
+the ``booking.W001`` check warns about. Releases stay guarded either way,
+so extra leaders only repeat work.
+"""
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+LEADER_KEY = 'booking:hold-expiry:leader'
+# Cache backends whose entries no other process can see.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel keyed on integer ticks.
+
+    Level 0 has ``slots`` one-tick slots; each higher level has ``slots``
+    slots covering a whole turn of the level below, and is cascaded down
+    as that turn comes round. Deadlines beyond the top level wait in an
+    overflow list.
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=2, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow = []
+        self.current = int((time.time() if now is None else now) // tick)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def schedule(self, deadline, item):
+        self._place(max(math.ceil(deadline / self.tick), self.current + 1), item)
+        self.size += 1
+
+    def _place(self, due, item):
+        delta = due - self.current
+        for level, wheel in enumerate(self.wheels):
+            if delta < self.slots ** (level + 1):
+                wheel[(due // self.slots ** level) % self.slots].append((due, item))
+                return
+        self.overflow.append((due, item))
+
+    def advance(self, now):
+        """Move to ``now`` and return the items that fell due, in order."""
+        due = []
+        target = int(now // self.tick)
+        while self.current < target:
+            self.current += 1
+            self._cascade()
+            slot = self.current % self.slots
+            fired, self.wheels[0][slot] = self.wheels[0][slot], []
+            due.extend(item for _, item in fired)
+        self.size -= len(due)
+        return due
+
+    def _cascade(self):
+        for level in range(1, len(self.wheels)):
+            span = self.slots ** level
+            if self.current % span:
+                return
+            slot = (self.current // span) % self.slots
+            entries, self.wheels[level][slot] = self.wheels[level][slot], []
+            for due, item in entries:
+                self._place(due, item)
+        if self.current % self.slots ** len(self.wheels) == 0:
+            entries, self.overflow = self.overflow, []
+            for due, item in entries:
+                self._place(due, item)
+
+    def clear(self):
+        for wheel in self.wheels:
+            for slot in wheel:
+                slot.clear()
+        self.overflow.clear()
+        self.size = 0
+
+
+class HoldExpiryScheduler:
+    def __init__(self, tick=1.0, sync_interval=5.0, lease_seconds=15.0):
+        from .models import RESERVATION_TIMEOUT_MINUTES
+
+        self.hold = timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
+        self.wheel = TimerWheel(tick)
+        self.sync_interval = sync_interval
+        self.lease_seconds = lease_seconds
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{id(self)}"
+        self.is_leader = False
+        self.watermark = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def schedule(self, show_id, seat_ids, reserved_at):
+        # Followers keep no wheel; a new leader loads every hold from the
+        # database anyway, so anything dropped here is not lost.
+        if self.is_leader:
+            self._add(show_id, seat_ids, reserved_at)
+
+    def _add(self, show_id, seat_ids, reserved_at):
+        deadline = (reserved_at + self.hold).timestamp()
+        with self._lock:
+            for seat_id in seat_ids:
+                self.wheel.schedule(deadline, (show_id, seat_id))
+
+    def _load(self, seats):
+        for seat_id, show_id, reserved_at in seats.values_list('id', 'show_id', 'reserved_at').iterator():
+            if reserved_at:
+                self._add(show_id, [seat_id], reserved_at)
+
+    def rebuild(self, now=None):
+        """Reload every stored hold, e.g. after starting or taking over."""
+        from .models import ShowSeat
+
+        now = now or timezone.now()
+        with self._lock:
+            self.wheel.clear()
+        self._load(ShowSeat.objects.filter(is_booked=False, reserved_by__isnull=False))
+        self.watermark = now
+
+    def sync(self, now=None):
+        """Pick up holds placed by other workers since the last sync."""
+        from .models import ShowSeat
+
+        now = now or timezone.now()
+        # Overlap a little for clock skew between workers; duplicates only
+        # cost a no-op release.
+        since = self.watermark - timedelta(seconds=self.sync_interval)
+        self._load(ShowSeat.objects.filter(is_booked=False, reserved_by__isnull=False, reserved_at__gt=since))
+        self.watermark = now
+
+    def tick(self, now=None):
+        """Release the holds due by ``now`` with one guarded UPDATE per show."""
+        from .models import ShowSeat
+
+        now = now or timezone.now()
+        with self._lock:
+            due = self.wheel.advance(now.timestamp())
+
+        per_show = {}
+        for show_id, seat_id in due:
+            per_show.setdefault(show_id, []).append(seat_id)
+
+        released = 0
+        for show_id, seat_ids in per_show.items():
+            released += ShowSeat.objects.filter(show_id=show_id, id__in=seat_ids).release_expired(now)
+        return released
+
+    def elect(self):
+        if cache.add(LEADER_KEY, self.identity, self.lease_seconds):
+            return True
+        if cache.get(LEADER_KEY) != self.identity:
+            return False
+        # touch() only extends the expiry: if the lease lapsed and another
+        # worker took it in between, it extends theirs, and the second read
+        # hands them the lead instead of overwriting it.
+        return cache.touch(LEADER_KEY, self.lease_seconds) and cache.get(LEADER_KEY) == self.identity
+
+    def step(self):
+        leader = self.elect()
+        if leader and not self.is_leader:
+            logger.info("Hold expiry scheduler %s took the lead", self.identity)
+            self.rebuild()
+            self._last_sync = time.monotonic()
+        elif not leader and self.is_leader:
+            with self._lock:
+                self.wheel.clear()
+        self.is_leader = leader
+        if not leader:
+            return 0
+
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+            self._last_sync = time.monotonic()
+        return self.tick()
+
+    def run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.step()
+                except Exception as e:
+                    logger.error(f"Hold expiry tick failed: {e}")
+                finally:
+                    close_old_connections()
+                self._stop.wait(self.wheel.tick)
+        except KeyboardInterrupt:
+            self._stop.set()
+        finally:
+            # Hand the lease over now rather than when it times out.
+            if self.is_leader and cache.get(LEADER_KEY) == self.identity:
+                cache.delete(LEADER_KEY)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='hold-expiry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+@checks.register()
+def check_leader_cache(app_configs, **kwargs):
+    if getattr(settings, 'HOLD_EXPIRY_SCHEDULER', False) and not cache_is_shared():
+        return [checks.Warning(
+            "HOLD_EXPIRY_SCHEDULER is on but the default cache is local to each process, "
+            "so every worker elects itself leader.",
+            hint="Set CACHE_REDIS_URL, or run a single worker.",
+            id='booking.W001',
+        )]
+    return []
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(start=True):
+    global _scheduler
+    if _scheduler is None and start and getattr(settings, 'HOLD_EXPIRY_SCHEDULER', False):
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = HoldExpiryScheduler(
+                    tick=getattr(settings, 'HOLD_EXPIRY_TICK_SECONDS', 1.0),
+                    sync_interval=getattr(settings, 'HOLD_EXPIRY_SYNC_SECONDS', 5.0),
+                )
+                _scheduler.start()
+    return _scheduler
+
+
+def schedule_hold_expiry(show_id, seat_ids, reserved_at):
+    seat_ids = list(seat_ids)
+
+    def schedule():
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            scheduler.schedule(show_id, seat_ids, reserved_at)
+
+    transaction.on_commit(schedule)
@@ -0,0 +1,244 @@
+"""
+Payment gateway adapters for the booking flow.
+
+``get_gateway()`` returns a process-wide adapter named by
+``PAYMENT_GATEWAY``. ``RazorpayGateway`` talks to Razorpay over one
+pooled keep-alive session with connect/read timeouts; ``FakeGateway``
+answers locally with Razorpay-shaped orders and signatures so the booking
+flow can be exercised and load-tested without network access.
+
+Both share the same call path: transient failures are retried with
+jittered exponential backoff, a circuit breaker fails fast while the
+gateway is degraded, and latency/error counters are kept in ``stats``.
+"""
+import hashlib
+import hmac
+import logging
+import random
+import threading
+import time
+import uuid
+
+import razorpay
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class SignatureMismatch(PaymentGatewayError):
+    pass
+
+
+class CircuitOpen(PaymentGatewayError):
+    pass
+
+
+# Errors that say the gateway, not the request, is unhealthy.
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    razorpay.errors.ServerError,
+    razorpay.errors.GatewayError,
+)
+
+
+def payment_signature(order_id, payment_id, secret):
+    message = f"{order_id}|{payment_id}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let a single trial call through to probe the gateway.
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpen("Payment gateway is unavailable, please try again shortly")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Payment gateway circuit opened after %s failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class GatewayStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def observe(self, seconds, ok=True):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.latency_total += seconds
+            self.latency_max = max(self.latency_max, seconds)
+
+    def increment(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'latency_avg': self.latency_total / self.calls if self.calls else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+
+class BaseGateway:
+    def __init__(self, key_id=None, key_secret=None, webhook_secret=None, max_retries=2,
+                 backoff=0.25, failure_threshold=5, reset_timeout=30.0):
+        self.key_id = key_id or settings.RAZORPAY_KEY_ID
+        self.key_secret = key_secret or settings.RAZORPAY_KEY_SECRET
+        self.webhook_secret = webhook_secret or getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', '')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.stats = GatewayStats()
+
+    def _call(self, operation):
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self.stats.increment('rejected')
+            raise
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            try:
+                result = operation()
+            except TRANSIENT_ERRORS as e:
+                self.stats.observe(time.monotonic() - started, ok=False)
+                if attempt == self.max_retries:
+                    self.breaker.record_failure()
+                    raise PaymentGatewayError(str(e)) from e
+                self.stats.increment('retries')
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            except Exception as e:
+                # The gateway answered; the request itself was refused.
+                self.stats.observe(time.monotonic() - started, ok=False)
+                self.breaker.record_success()
+                raise PaymentGatewayError(str(e)) from e
+            else:
+                self.stats.observe(time.monotonic() - started)
+                self.breaker.record_success()
+                return result
+
+    def create_order(self, amount_in_paise, receipt):
+        return self._call(lambda: self._create_order({
+            'amount': amount_in_paise,
+            'currency': 'INR',
+            'receipt': receipt,
+            'payment_capture': 1
+        }))
+
+    def _create_order(self, data):
+        raise NotImplementedError
+
+    def sign(self, order_id, payment_id):
+        return payment_signature(order_id, payment_id, self.key_secret)
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        if not hmac.compare_digest(self.sign(order_id, payment_id), signature or ''):
+            raise SignatureMismatch("Razorpay Signature Verification Failed")
+
+    def sign_webhook(self, body):
+        return hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+
+    def verify_webhook_signature(self, body, signature):
+        if not self.webhook_secret or not hmac.compare_digest(self.sign_webhook(body), signature or ''):
+            raise SignatureMismatch("Razorpay Webhook Signature Verification Failed")
+
+
+class RazorpayGateway(BaseGateway):
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, pool_size=10, **kwargs):
+        super().__init__(**kwargs)
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.client = razorpay.Client(session=self.session, auth=(self.key_id, self.key_secret))
+
+    def _create_order(self, data):
+        # A retried timeout can leave an orphaned unpaid order behind, which
+        # Razorpay expires on its own; it is never charged.
+        return self.client.order.create(data, timeout=self.timeout)
+
+
+class FakeGateway(BaseGateway):
+    def __init__(self, latency=0.0, failure_rate=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def _create_order(self, data):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise requests.exceptions.ConnectionError("Fake gateway dropped the connection")
+        return {
+            'id': f"order_fake{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': data['amount'],
+            'currency': data['currency'],
+            'receipt': data['receipt'],
+            'status': 'created',
+        }
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway():
+    path = getattr(settings, 'PAYMENT_GATEWAY', 'booking.gateway.RazorpayGateway')
+    options = getattr(settings, 'PAYMENT_GATEWAY_OPTIONS', {})
+    key = (path, repr(sorted(options.items())))
+    gateway = _gateways.get(key)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(key)
+            if gateway is None:
+                gateway = _gateways[key] = import_string(path)(**options)
+    return gateway
@@ -0,0 +1,51 @@
+"""
+A user's booking history for the profile page.
+
+Bookings come with their show, movie and theatre joined in and their
+seats prefetched, so a page costs the same few queries however many
+bookings it shows. Bookings for shows that are still to come are listed
+soonest first, up to ``UPCOMING_LIMIT``; everything else (past shows,
+failed bookings and payments abandoned past the hold timeout) is paged
+newest first with keyset cursors.
+"""
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+
+from bookmyseat.pagination import InvalidCursor, keyset_paginate
+
+from .models import Booking, ShowSeat, reservation_cutoff
+
+
+HISTORY_PER_PAGE = 10
+UPCOMING_LIMIT = 20
+PAST_ORDERING = ('-id',)
+
+
+def user_bookings(user):
+    return (
+        Booking.objects.filter(user=user)
+        .select_related('show__movie', 'show__screen__theatre')
+        .prefetch_related(Prefetch('seats', ShowSeat.objects.order_by('row', 'number')))
+    )
+
+
+def _upcoming(now):
+    # A PENDING booking older than the hold timeout was abandoned at payment.
+    abandoned = Q(status='PENDING', created_at__lte=reservation_cutoff(now))
+    now = timezone.localtime(now)
+    return (
+        (Q(show__date__gt=now.date()) | Q(show__date=now.date(), show__time__gte=now.time()))
+        & ~Q(status__in=('FAILED', 'REFUND')) & ~abandoned
+    )
+
+
+def upcoming_bookings(user, now=None, limit=UPCOMING_LIMIT):
+    return list(user_bookings(user).filter(_upcoming(now)).order_by('show__date', 'show__time', 'id')[:limit])
+
+
+def past_bookings(user, cursor=None, per_page=HISTORY_PER_PAGE, now=None):
+    past = user_bookings(user).exclude(_upcoming(now))
+    try:
+        return keyset_paginate(past, PAST_ORDERING, cursor, per_page)
+    except InvalidCursor:
+        return keyset_paginate(past, PAST_ORDERING, None, per_page)
@@ -0,0 +1,14 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from booking.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat, help="Only rebuild days from this date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups(options['since'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups for {days} day(s)"))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from booking.emails import build_booking_confirmation, confirmation_bookings
+
+class Command(BaseCommand):
+    help = "Measure the per-email cost of rendering booking confirmations"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--booking', type=int, help="Booking id to render (defaults to the latest confirmed one)")
+        parser.add_argument('--count', type=int, default=500)
+
+    def handle(self, *args, **options):
+        bookings = confirmation_bookings()
+        if options['booking']:
+            booking = bookings.filter(id=options['booking']).first()
+        else:
+            booking = bookings.filter(status='CONFIRMED').order_by('-id').first()
+        if booking is None:
+            raise CommandError("No booking to render")
+
+        with CaptureQueriesContext(connection) as queries:
+            fetched = confirmation_bookings().get(id=booking.id)
+        self.stdout.write(f"Fetching booking {booking.id}: {len(queries)} queries")
+
+        # The first build compiles the templates and caches the QR image.
+        started = time.perf_counter()
+        build_booking_confirmation(fetched).message().as_bytes()
+        self.stdout.write(f"First render: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+        count = options['count']
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(count):
+                build_booking_confirmation(fetched).message().as_bytes()
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered {count} email(s): {elapsed / count * 1000:.3f} ms each, "
+                f"{len(queries)} queries"
+            )
+        )
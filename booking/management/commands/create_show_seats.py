@@ -1,25 +1,57 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
 from django.core.management.base import BaseCommand
-from booking.models import Show, ShowSeat, Seat
+from django.db import connections
+from booking.models import Show
+from booking.seating import create_show_seats, shows_without_seats
+
+
+def _fill_dates(dates, batch_size):
+    # Runs in a forked worker, which must not share the parent's connections.
+    connections.close_all()
+    try:
+        return create_show_seats(Show.objects.filter(date__in=dates), batch_size)
+    finally:
+        connections.close_all()
+
 
 class Command(BaseCommand):
-    help = "Create ShowSeat entries for each show"
-
-    def handle(self, *args, **kwargs):
-        for show in Show.objects.all():
-            if ShowSeat.objects.filter(show=show).exists():
-                self.stdout.write(f"ShowSeats already exist for Show {show.id}")
-                continue
-
-            seats = Seat.objects.filter(screen=show.screen)
-            for seat in seats:
-                ShowSeat.objects.create(
-                    show=show,
-                    row=seat.row,
-                    number=seat.seat_number,
-                    is_booked=False
-                )
-
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"ShowSeats created for Show {show.id}")
+    help = "Create ShowSeat entries for shows that have none"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Seats written per transaction")
+        parser.add_argument('--workers', type=int, default=1, help="Processes to split the pending dates across")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        workers = options['workers']
+        if workers > 1:
+            filled, created = self.fill_in_parallel(workers, options['batch_size'])
+        else:
+            filled, created = create_show_seats(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+
+        if not filled:
+            self.stdout.write("All shows already have seats.")
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} seats for {filled} show(s) in {elapsed:.2f}s "
+                f"({created / max(elapsed, 1e-6):.0f} seats/s)"
             )
+        )
+
+    def fill_in_parallel(self, workers, batch_size):
+        dates = list(shows_without_seats().order_by('date').values_list('date', flat=True).distinct())
+        if not dates:
+            return 0, 0
+        # Contiguous date ranges, so each worker writes its own slice of the schedule.
+        size = -(-len(dates) // workers)
+        ranges = [dates[i:i + size] for i in range(0, len(dates), size)]
+
+        connections.close_all()
+        with ProcessPoolExecutor(len(ranges), mp_context=get_context('fork')) as pool:
+            results = list(pool.map(_fill_dates, ranges, [batch_size] * len(ranges)))
+        return sum(r[0] for r in results), sum(r[1] for r in results)
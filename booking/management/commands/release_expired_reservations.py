@@ -1,32 +1,67 @@
+import time
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.db.models import Count
 from django.utils import timezone
-from datetime import timedelta
-from booking.models import ShowSeat, RESERVATION_TIMEOUT_MINUTES
+from booking.models import Show, ShowSeat, RESERVATION_TIMEOUT_MINUTES
 
 class Command(BaseCommand):
     help = "Release expired seat reservations"
 
-    def handle(self, *args, **kwargs):
-        current_time = timezone.now()
-        expired_seats = []
-        
-        reserved_seats = ShowSeat.objects.filter(
-            reserved_by__isnull=False,
-            is_booked=False
-        )
-        
-        for seat in reserved_seats:
-            expiry_time = seat.reserved_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
-            if current_time > expiry_time:
-                seat.release()
-                expired_seats.append(f"{seat.row}{seat.number} (Show: {seat.show.id})")
-        
-        if expired_seats:
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"Released {len(expired_seats)} expired reservations:\n" + 
-                    "\n".join(f"  - {seat}" for seat in expired_seats)
-                )
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Seats released per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be released")
+        parser.add_argument('--loop', action='store_true', help="Keep running, waking when the next hold lapses")
+        parser.add_argument('--max-sleep', type=float, default=60.0, help="Longest wait between sweeps with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            if options['dry_run']:
+                per_show = self.pending()
+            else:
+                per_show = self.sweep(options['chunk_size'])
+            self.report(per_show, options['dry_run'], quiet=options['loop'])
+
+            if not options['loop'] or options['dry_run']:
+                break
+            time.sleep(self.seconds_until_next_expiry(options['max_sleep']))
+
+    def pending(self):
+        rows = ShowSeat.objects.expired().values('show_id').annotate(n=Count('id')).order_by()
+        return {row['show_id']: row['n'] for row in rows}
+
+    def sweep(self, chunk_size):
+        per_show = {}
+        while True:
+            released = ShowSeat.objects.release_expired_chunk(limit=chunk_size)
+            for show_id, count in released.items():
+                per_show[show_id] = per_show.get(show_id, 0) + count
+            if sum(released.values()) < chunk_size:
+                return per_show
+
+    def seconds_until_next_expiry(self, max_sleep):
+        now = timezone.now()
+        # With nothing held, no hold can lapse sooner than a new one would.
+        next_expiry = ShowSeat.objects.next_expiry(now) or now + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
+        return min(max((next_expiry - now).total_seconds(), 0.1), max_sleep)
+
+    def report(self, per_show, dry_run, quiet=False):
+        if not per_show:
+            if not quiet:
+                self.stdout.write("No expired reservations found.")
+            return
+
+        shows = Show.objects.select_related('movie').in_bulk(list(per_show))
+        verb = "Would release" if dry_run else "Released"
+        lines = []
+        for show_id, count in sorted(per_show.items()):
+            show = shows.get(show_id)
+            label = f"{show.movie.name} {show.date} {show.time:%H:%M}" if show else "deleted show"
+            lines.append(f"  - Show {show_id} ({label}): {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {sum(per_show.values())} expired reservations across {len(per_show)} show(s):\n"
+                + "\n".join(lines)
             )
-        else:
-            self.stdout.write("No expired reservations found.")
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from booking.models import Show
+
+class Command(BaseCommand):
+    help = "Recount each show's available/held/booked seat counters from its seats"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show', type=int, action='append', dest='shows', help="Only this show (repeatable)")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it")
+
+    def handle(self, *args, **options):
+        shows = Show.objects.all()
+        if options['shows']:
+            shows = shows.filter(id__in=options['shows'])
+
+        drifted = shows.with_seat_recount().filter(
+            ~Q(seats_available=F('actual_available'))
+            | ~Q(seats_held=F('actual_held'))
+            | ~Q(seats_booked=F('actual_booked'))
+        )
+        for show in drifted.values('id', 'seats_available', 'seats_held', 'seats_booked',
+                                   'actual_available', 'actual_held', 'actual_booked'):
+            self.stdout.write(
+                f"Show {show['id']}: {show['seats_available']}/{show['seats_held']}/{show['seats_booked']}"
+                f" -> {show['actual_available']}/{show['actual_held']}/{show['actual_booked']}"
+            )
+
+        if options['dry_run']:
+            return
+
+        updated = shows.recount_seats()
+        self.stdout.write(self.style.SUCCESS(f"Recounted seats for {updated} show(s)"))
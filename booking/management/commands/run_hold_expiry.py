@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from booking.expiry import HoldExpiryScheduler
+
+class Command(BaseCommand):
+    help = "Release seat holds as they expire, while this process holds the leader lease"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=getattr(settings, 'HOLD_EXPIRY_TICK_SECONDS', 1.0))
+        parser.add_argument('--sync-interval', type=float, default=getattr(settings, 'HOLD_EXPIRY_SYNC_SECONDS', 5.0))
+
+    def handle(self, *args, **options):
+        scheduler = HoldExpiryScheduler(tick=options['tick'], sync_interval=options['sync_interval'])
+        self.stdout.write(f"Hold expiry scheduler {scheduler.identity} running (tick {options['tick']}s)")
+        scheduler.run()
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from booking.outbox import drain
+
+class Command(BaseCommand):
+    help = "Send queued transactional emails from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help="Keep draining until interrupted")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds between drains with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = drain(batch_size=options['batch_size'])
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                self.stderr.write(f"Draining the outbox failed: {e}")
+                sent = failed = 0
+            if sent or failed or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(f"Sent {sent} email(s), {failed} failed")
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
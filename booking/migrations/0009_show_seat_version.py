@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_booking_ticket_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='seat_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_show_seat_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='showseat',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_showseat_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=100, unique=True)),
+                ('order_id', models.CharField(max_length=100)),
+                ('event', models.CharField(max_length=50)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
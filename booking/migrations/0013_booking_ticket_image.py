@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0012_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='ticket_image',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
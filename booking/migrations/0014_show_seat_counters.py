@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Show = apps.get_model('booking', 'Show')
+    ShowSeat = apps.get_model('booking', 'ShowSeat')
+
+    def seat_count(**filters):
+        seats = ShowSeat.objects.filter(show=OuterRef('pk'), **filters).order_by()
+        return Coalesce(Subquery(seats.values('show').annotate(n=Count('pk')).values('n')), 0)
+
+    Show.objects.update(
+        seats_available=seat_count(is_booked=False, reserved_by__isnull=True),
+        seats_held=seat_count(is_booked=False, reserved_by__isnull=False),
+        seats_booked=seat_count(is_booked=True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0013_booking_ticket_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='seats_available',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='show',
+            name='seats_booked',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='show',
+            name='seats_held',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='show',
+            index=models.Index(fields=['date', 'seats_available'], name='booking_sho_date_312654_idx'),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
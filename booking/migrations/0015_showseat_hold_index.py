@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0014_show_seat_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='showseat',
+            index=models.Index(condition=models.Q(('is_booked', False), ('reserved_by__isnull', False)), fields=['reserved_at'], name='booking_showseat_hold_idx'),
+        ),
+    ]
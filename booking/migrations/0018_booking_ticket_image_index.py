@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0017_booking_refund_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='ticket_image',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100),
+        ),
+    ]
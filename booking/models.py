@@ -1,13 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 from movies.models import Movie
+from .events import publish_seat_changes
+from .expiry import schedule_hold_expiry
 
 
 RESERVATION_TIMEOUT_MINUTES = 5
 
 
+def reservation_cutoff(now=None):
+    # Holds placed at or before this instant have expired.
+    return (now or timezone.now()) - timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
+
+
 class Theatre(models.Model):
     name = models.CharField(max_length=100)
     city = models.CharField(max_length=50)
@@ -37,16 +47,217 @@ class Seat(models.Model):
         return f"{self.row}{self.seat_number}"
 
 
+def _seat_count(**filters):
+    seats = ShowSeat.objects.filter(show=OuterRef('pk'), **filters).order_by()
+    return Coalesce(Subquery(seats.values('show').annotate(n=Count('pk')).values('n')), 0)
+
+
+class ShowQuerySet(models.QuerySet):
+    def with_seat_recount(self):
+        return self.annotate(
+            actual_available=_seat_count(is_booked=False, reserved_by__isnull=True),
+            actual_held=_seat_count(is_booked=False, reserved_by__isnull=False),
+            actual_booked=_seat_count(is_booked=True),
+        )
+
+    def with_lapsed_holds(self, now=None):
+        # Lapsed holds still count as held until they are released; add
+        # ``lapsed_holds`` back to ``seats_available`` for what can be sold.
+        return self.annotate(lapsed_holds=_seat_count(
+            is_booked=False, reserved_by__isnull=False, reserved_at__lte=reservation_cutoff(now),
+        ))
+
+    def recount_seats(self):
+        """Reset the seat counters from the ShowSeat rows in one UPDATE."""
+        return self.update(
+            seats_available=_seat_count(is_booked=False, reserved_by__isnull=True),
+            seats_held=_seat_count(is_booked=False, reserved_by__isnull=False),
+            seats_booked=_seat_count(is_booked=True),
+        )
+
+
 class Show(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     screen = models.ForeignKey(Screen, on_delete=models.CASCADE)
     date = models.DateField()
     time = models.TimeField()
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    seat_version = models.PositiveIntegerField(default=0, editable=False)
+    # Seat counts by stored state, kept in step by every seat transition:
+    # ShowSeat.save() (creates and updates alike) and deletes adjust them,
+    # and the bulk paths (claim, release_expired, Booking._transition_seats,
+    # create_show_seats) adjust them in the same transaction. Any other
+    # queryset update() or bulk_create() of ShowSeat must do the same, or
+    # run repair_seat_counters. A hold that has lapsed but not been released
+    # yet still counts as held; see ShowQuerySet.with_lapsed_holds.
+    seats_available = models.IntegerField(default=0, editable=False)
+    seats_held = models.IntegerField(default=0, editable=False)
+    seats_booked = models.IntegerField(default=0, editable=False)
+
+    objects = ShowQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'seats_available']),
+        ]
 
     def __str__(self):
         return f"{self.movie.name} - {self.date} {self.time}"
 
+    @property
+    def is_houseful(self):
+        # Booked seats never go back, so this can be trusted even when read
+        # without a lock; a show whose seats don't exist yet is not houseful.
+        # Any held seat, lapsed or not, leaves it to the claim to decide.
+        return bool(self.seats_booked) and not self.seats_available and not self.seats_held
+
+
+def _count_changes(available=0, held=0, booked=0):
+    return {
+        field: F(field) + delta
+        for field, delta in (('seats_available', available), ('seats_held', held), ('seats_booked', booked))
+        if delta
+    }
+
+
+def adjust_seat_counts(show_id, **counts):
+    changes = _count_changes(**counts)
+    if changes:
+        Show.objects.filter(pk=show_id).update(**changes)
+
+
+# ShowSeat fields that decide which counter a seat is in.
+COUNTED_FIELDS = {'show', 'show_id', 'is_booked', 'reserved_by', 'reserved_by_id'}
+
+
+def _seat_bucket(is_booked, reserved_by_id):
+    if is_booked:
+        return 'booked'
+    return 'held' if reserved_by_id else 'available'
+
+
+def next_seat_version(show_id, **counts):
+    # Any change to a show's seats invalidates cached seat maps keyed on this;
+    # the changed seats are stamped with the returned expression so clients
+    # can ask for everything that changed since the version they last saw.
+    # ``counts`` adjusts the availability counters in the same UPDATE.
+    Show.objects.filter(pk=show_id).update(seat_version=F('seat_version') + 1, **_count_changes(**counts))
+    return Subquery(Show.objects.filter(pk=show_id).values('seat_version')[:1])
+
+
+def bump_seat_version(show_id, seat_ids):
+    ShowSeat.objects.filter(show_id=show_id, id__in=seat_ids).update(
+        version=next_seat_version(show_id)
+    )
+    transaction.on_commit(lambda: publish_seat_changes(show_id, seat_ids))
+
+
+class SeatUnavailable(Exception):
+    def __init__(self, seats, missing=()):
+        self.seats = seats
+        self.missing = list(missing)
+        super().__init__(", ".join(str(seat) for seat in seats) or "Seats not found")
+
+
+class ShowSeatQuerySet(models.QuerySet):
+    def held(self, now=None):
+        return self.filter(
+            is_booked=False,
+            reserved_by__isnull=False,
+            reserved_at__gt=reservation_cutoff(now),
+        )
+
+    def expired(self, now=None):
+        return self.filter(
+            is_booked=False,
+            reserved_by__isnull=False,
+            reserved_at__lte=reservation_cutoff(now),
+        )
+
+    def available(self, now=None):
+        return self.filter(is_booked=False).exclude(
+            reserved_by__isnull=False,
+            reserved_at__gt=reservation_cutoff(now),
+        )
+
+    def release_expired(self, now=None):
+        show_ids = sorted(set(self.expired(now).order_by().values_list('show_id', flat=True)))
+        released = 0
+        for show_id in show_ids:
+            with transaction.atomic():
+                # Seats first, then the show's counters by exactly the rows
+                # that changed: the lock order of every other transition, and
+                # a hold re-claimed meanwhile is neither released nor counted.
+                count = self.filter(show_id=show_id).expired(now).update(reserved_by=None, reserved_at=None)
+                adjust_seat_counts(show_id, held=-count, available=count)
+            released += count
+        return released
+
+    def release_expired_chunk(self, now=None, limit=1000):
+        """
+        Release up to ``limit`` of the oldest lapsed holds.
+
+        Returns how many seats were picked per show. Walks the hold index on
+        ``reserved_at``, so repeated calls drain a backlog without scanning it.
+        """
+        rows = list(
+            self.expired(now).order_by('reserved_at').values_list('id', 'show_id')[:limit]
+        )
+        if not rows:
+            return {}
+        self.model.objects.filter(id__in=[seat_id for seat_id, _ in rows]).release_expired(now)
+        per_show = {}
+        for _, show_id in rows:
+            per_show[show_id] = per_show.get(show_id, 0) + 1
+        return per_show
+
+    def next_expiry(self, now=None):
+        """When the earliest live hold lapses, or ``None`` if nothing is held."""
+        reserved_at = self.held(now).order_by('reserved_at').values_list('reserved_at', flat=True).first()
+        if reserved_at is None:
+            return None
+        return reserved_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
+
+    def claim(self, show, seat_ids, user, now=None):
+        """
+        Hold ``seat_ids`` of ``show`` for ``user`` with one conditional UPDATE.
+
+        A seat can be claimed when it is not booked and is unheld, holds an
+        expired reservation, or is already held by ``user``. Either every seat
+        is claimed or none is: on a shortfall the claim is rolled back and
+        ``SeatUnavailable`` names the seats that conflicted.
+        """
+        now = now or timezone.now()
+        seat_ids = set(seat_ids)
+
+        with transaction.atomic():
+            claimable = self.filter(show=show, id__in=seat_ids, is_booked=False)
+            # Taking over a lapsed (or our own) hold leaves the counters
+            # alone, so it is a separate UPDATE from claiming free seats.
+            retaken = claimable.filter(reserved_by__isnull=False).filter(
+                Q(reserved_at__lte=reservation_cutoff(now)) | Q(reserved_by=user)
+            ).update(reserved_by=user, reserved_at=now)
+            freed = claimable.filter(reserved_by__isnull=True).update(reserved_by=user, reserved_at=now)
+
+            if retaken + freed != len(seat_ids):
+                found = self.filter(show=show, id__in=seat_ids).order_by('row', 'number')
+                conflicts = [
+                    seat for seat in found
+                    if seat.is_booked or seat.reserved_by_id != user.id or seat.reserved_at != now
+                ]
+                missing = seat_ids - {seat.id for seat in found}
+                raise SeatUnavailable(conflicts, missing)
+
+            # The show row is locked from here to commit, so it is touched
+            # last, and a claim that falls short never touches it at all.
+            self.filter(show=show, id__in=seat_ids).update(
+                version=next_seat_version(show.id, available=-freed, held=freed)
+            )
+            schedule_hold_expiry(show.id, seat_ids, now)
+
+        transaction.on_commit(lambda: publish_seat_changes(show.id, seat_ids))
+        return sorted(seat_ids)
+
 
 class ShowSeat(models.Model):
     show = models.ForeignKey(Show, on_delete=models.CASCADE, related_name="seats")
@@ -55,12 +266,24 @@ class ShowSeat(models.Model):
     is_booked = models.BooleanField(default=False)
     reserved_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     reserved_at = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ShowSeatQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Only live holds are ever looked up by age.
+            models.Index(
+                fields=['reserved_at'], name='booking_showseat_hold_idx',
+                condition=Q(is_booked=False, reserved_by__isnull=False),
+            ),
+        ]
 
     @property
     def is_reserved(self):
         if self.is_booked:
             return True
-        if self.reserved_by and self.reserved_at:
+        if self.reserved_by_id and self.reserved_at:
             expiry_time = self.reserved_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
             return timezone.now() < expiry_time
         return False
@@ -71,15 +294,45 @@ class ShowSeat(models.Model):
             return self.reserved_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
         return None
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        tracked = update_fields is None or bool(set(update_fields) & COUNTED_FIELDS)
+        with transaction.atomic():
+            # The stored row is read (and locked) first, so the counters move
+            # by what actually changed even when this instance is stale.
+            stored = None
+            if not self._state.adding and tracked:
+                stored = ShowSeat.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'show_id', 'is_booked', 'reserved_by_id'
+                ).first()
+            adding = self._state.adding or (tracked and stored is None)
+            super().save(*args, **kwargs)
+
+            after = (self.show_id, _seat_bucket(self.is_booked, self.reserved_by_id))
+            before = stored and (stored[0], _seat_bucket(stored[1], stored[2]))
+            if adding:
+                adjust_seat_counts(after[0], **{after[1]: 1})
+            elif before and before != after:
+                if before[0] == after[0]:
+                    adjust_seat_counts(after[0], **{before[1]: -1, after[1]: 1})
+                else:
+                    adjust_seat_counts(before[0], **{before[1]: -1})
+                    adjust_seat_counts(after[0], **{after[1]: 1})
+
+    def _move(self, **changes):
+        for field, value in changes.items():
+            setattr(self, field, value)
+        with transaction.atomic():
+            self.save()
+            bump_seat_version(self.show_id, [self.pk])
+
     def reserve(self, user):
-        self.reserved_by = user
-        self.reserved_at = timezone.now()
-        self.save()
+        with transaction.atomic():
+            self._move(reserved_by=user, reserved_at=timezone.now())
+            schedule_hold_expiry(self.show_id, [self.pk], self.reserved_at)
 
     def release(self):
-        self.reserved_by = None
-        self.reserved_at = None
-        self.save()
+        self._move(reserved_by=None, reserved_at=None)
 
     def __str__(self):
         return f"{self.row}{self.number}"
@@ -89,6 +342,7 @@ class Booking(models.Model):
         ('PENDING', 'Pending'),
         ('CONFIRMED', 'Confirmed'),
         ('FAILED', 'Failed'),
+        ('REFUND', 'Refund due'),
     )
 
     user = models.ForeignKey(
@@ -107,6 +361,8 @@ class Booking(models.Model):
     razorpay_signature = models.CharField(max_length=200, null=True, blank=True)
 
     ticket_reference = models.CharField(max_length=20, unique=True, null=True, blank=True)
+    # Content-addressed QR image name under TICKET_IMAGE_ROOT, set once rendered.
+    ticket_image = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
@@ -117,6 +373,23 @@ class Booking(models.Model):
             self.ticket_reference = f"{prefix}{unique_part}"
         super().save(*args, **kwargs)
 
+    def _transition_seats(self, counts, **changes):
+        # Only seats this booking's user still holds change; a hold that
+        # lapsed and was claimed by someone else is left alone.
+        with transaction.atomic():
+            updated = ShowSeat.objects.filter(
+                booking=self, is_booked=False, reserved_by_id=self.user_id
+            ).update(version=next_seat_version(self.show_id), **changes)
+            adjust_seat_counts(self.show_id, **{field: delta * updated for field, delta in counts.items()})
+        transaction.on_commit(lambda: publish_seat_changes(self.show_id, self.seats.values('id')))
+        return updated
+
+    def confirm_seats(self):
+        return self._transition_seats({'held': -1, 'booked': 1}, is_booked=True, reserved_by=None, reserved_at=None)
+
+    def release_seats(self):
+        return self._transition_seats({'held': -1, 'available': 1}, reserved_by=None, reserved_at=None)
+
     @property
     def movie(self):
         return self.show.movie
@@ -135,3 +408,90 @@ class Booking(models.Model):
 
     def __str__(self):
         return f"Booking {self.id} - {self.user.username}"
+
+
+class PaymentEvent(models.Model):
+    payment_id = models.CharField(max_length=100, unique=True)
+    order_id = models.CharField(max_length=100)
+    event = models.CharField(max_length=50)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event} - {self.payment_id}"
+
+
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    )
+    KIND_CHOICES = (
+        ('booking_confirmation', 'Booking confirmation'),
+    )
+
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, null=True, blank=True)
+    recipient = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.kind} to {self.recipient} ({self.status})"
+
+
+class SalesRollup(models.Model):
+    # Confirmed bookings only, by the day the booking was made; kept up to
+    # date by booking.rollups and rebuilt by `manage.py backfill_sales_rollups`.
+    date = models.DateField()
+    bookings = models.PositiveIntegerField(default=0)
+    tickets_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    date = models.DateField(unique=True)
+    # Every booking started that day, whatever became of it.
+    created = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sales on {self.date}"
+
+
+class DailyMovieSales(SalesRollup):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('date', 'movie')
+
+    def __str__(self):
+        return f"{self.movie_id} sales on {self.date}"
+
+
+class DailyTheatreSales(SalesRollup):
+    theatre = models.ForeignKey(Theatre, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('date', 'theatre')
+
+    def __str__(self):
+        return f"{self.theatre_id} sales on {self.date}"
+
+
+def _uncount_deleted_seat(sender, instance, **kwargs):
+    # A signal rather than ShowSeat.delete(), so queryset and cascade deletes count too.
+    adjust_seat_counts(instance.show_id, **{_seat_bucket(instance.is_booked, instance.reserved_by_id): -1})
+
+
+post_delete.connect(_uncount_deleted_seat, sender=ShowSeat, dispatch_uid='booking.showseat.counters')
@@ -0,0 +1,151 @@
+"""
+Transactional email outbox.
+
+Messages are queued as ``OutboundEmail`` rows in the same transaction as
+the change that triggers them, and sent later by ``drain()`` over a single
+reused connection. ``drain()`` runs from the ``send_queued_emails``
+command or cron endpoint and, when ``EMAIL_OUTBOX_EAGER`` is on, right
+after the queuing transaction commits: on a background thread, or inline
+when ``BACKGROUND_THREADS`` is off. Failed sends are retried with
+exponential backoff until ``EMAIL_OUTBOX_MAX_ATTEMPTS``.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .emails import build_booking_confirmation
+from .models import OutboundEmail, ShowSeat
+
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed row is hidden from other workers while it is sent.
+CLAIM_LEASE = timedelta(minutes=5)
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 3600
+
+BUILDERS = {
+    'booking_confirmation': lambda entry: build_booking_confirmation(entry.booking),
+}
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='email-outbox')
+
+
+def queue_booking_confirmation(booking):
+    recipient = booking.user.email
+    if not recipient:
+        logger.error(f"User {booking.user.username} has no email address")
+        return None
+
+    entry = OutboundEmail.objects.create(
+        kind='booking_confirmation', booking=booking, recipient=recipient
+    )
+    if getattr(settings, 'EMAIL_OUTBOX_EAGER', True):
+        if getattr(settings, 'BACKGROUND_THREADS', True):
+            transaction.on_commit(lambda: _executor.submit(_drain_in_background))
+        else:
+            transaction.on_commit(_drain_safely)
+    return entry
+
+
+def _drain_safely():
+    try:
+        drain()
+    except Exception as e:
+        logger.error(f"Email outbox drain failed: {e}")
+
+
+def _drain_in_background():
+    try:
+        _drain_safely()
+    finally:
+        close_old_connections()
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .select_related('booking__user', 'booking__show__movie', 'booking__show__screen__theatre')
+            .prefetch_related(Prefetch('booking__seats', queryset=ShowSeat.objects.order_by('row', 'number')))
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboundEmail.objects.filter(id__in=[entry.id for entry in entries]).update(
+            next_attempt_at=now + CLAIM_LEASE
+        )
+    return entries
+
+
+def _retry_delay(attempts):
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _record_failure(entry, error, max_attempts):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    if entry.attempts >= max_attempts:
+        entry.status = 'FAILED'
+    else:
+        entry.next_attempt_at = timezone.now() + _retry_delay(entry.attempts)
+    entry.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    logger.error(f"Sending {entry} failed (attempt {entry.attempts}): {error}")
+
+
+def drain(batch_size=50):
+    """Send due messages in batches over one reused connection; returns (sent, failed)."""
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    sent = failed = 0
+
+    connection = None
+    try:
+        while True:
+            entries = _claim(batch_size)
+            if not entries:
+                break
+
+            if connection is None:
+                try:
+                    connection = get_connection(fail_silently=False)
+                    connection.open()
+                except Exception as e:
+                    # The mail server is down: every claimed message counts
+                    # a failed attempt and backs off, and the rest wait.
+                    connection = None
+                    for entry in entries:
+                        _record_failure(entry, e, max_attempts)
+                    failed += len(entries)
+                    break
+
+            for entry in entries:
+                try:
+                    message = BUILDERS[entry.kind](entry)
+                    message.to = [entry.recipient]
+                    message.connection = connection
+                    message.send()
+                except Exception as e:
+                    _record_failure(entry, e, max_attempts)
+                    failed += 1
+                else:
+                    entry.attempts += 1
+                    entry.status = 'SENT'
+                    entry.sent_at = timezone.now()
+                    entry.save(update_fields=['attempts', 'status', 'sent_at'])
+                    sent += 1
+
+            if len(entries) < batch_size:
+                break
+    finally:
+        if connection is not None:
+            connection.close()
+
+    return sent, failed
@@ -0,0 +1,113 @@
+"""
+Daily sales rollups behind the staff dashboard.
+
+``DailySales``, ``DailyMovieSales`` and ``DailyTheatreSales`` hold one row
+per day (and movie or theatre), keyed by the day the booking was made.
+The booking flow bumps them as bookings are created, confirmed or fail,
+so the dashboard only reads a few hundred small rows however many
+bookings there are. ``rebuild_rollups`` recomputes them from ``Booking``.
+
+Every booking of the day updates the same ``DailySales`` row. The bump
+for a new booking therefore waits until the seat claim has committed,
+so the claim's transaction never queues on that row. Confirm and fail
+bumps stay in their transactions, which already serialise per booking.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Booking, DailyMovieSales, DailySales, DailyTheatreSales, Show
+
+
+def _bump(model, keys, **deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Another booking created the row first.
+        model.objects.filter(**keys).update(**changes)
+
+
+def _day(booking):
+    return timezone.localdate(booking.created_at)
+
+
+def record_booking_created(booking):
+    day = _day(booking)
+    transaction.on_commit(lambda: _bump(DailySales, {'date': day}, created=1), robust=True)
+
+
+def record_booking_failed(booking):
+    _bump(DailySales, {'date': _day(booking)}, failed=1)
+
+
+def record_booking_reclaimed(booking):
+    # A failed booking that was paid after all; its confirmation follows.
+    _bump(DailySales, {'date': _day(booking)}, failed=-1)
+
+
+def record_booking_confirmed(booking, tickets):
+    day = _day(booking)
+    movie_id, theatre_id = Show.objects.filter(pk=booking.show_id).values_list('movie_id', 'screen__theatre_id').get()
+    sold = {'bookings': 1, 'tickets_sold': tickets, 'revenue': booking.total_amount}
+    _bump(DailySales, {'date': day}, **sold)
+    _bump(DailyMovieSales, {'date': day, 'movie_id': movie_id}, **sold)
+    _bump(DailyTheatreSales, {'date': day, 'theatre_id': theatre_id}, **sold)
+
+
+def ticket_count():
+    seats = Booking.seats.through.objects.filter(booking_id=OuterRef('pk')).order_by()
+    return Coalesce(Subquery(seats.values('booking_id').annotate(n=Count('pk')).values('n')), 0)
+
+
+def _sold(bookings, *keys):
+    confirmed = Q(status='CONFIRMED')
+    return (
+        bookings.annotate(day=TruncDate('created_at'), tickets=ticket_count())
+        .values('day', *keys)
+        .annotate(
+            n_bookings=Count('id', filter=confirmed),
+            n_tickets=Coalesce(Sum('tickets', filter=confirmed), 0),
+            n_revenue=Coalesce(Sum('total_amount', filter=confirmed), 0, output_field=Booking._meta.get_field('total_amount')),
+            n_created=Count('id'),
+            n_failed=Count('id', filter=Q(status__in=('FAILED', 'REFUND'))),
+        )
+        .order_by()
+    )
+
+
+def rebuild_rollups(since=None):
+    """Recompute the rollups from bookings made on or after ``since`` (or all). Returns the days written."""
+    bookings = Booking.objects.all()
+    if since:
+        bookings = bookings.filter(created_at__date__gte=since)
+    confirmed = bookings.filter(status='CONFIRMED')
+
+    def sold(row):
+        return {'date': row['day'], 'bookings': row['n_bookings'],
+                'tickets_sold': row['n_tickets'], 'revenue': row['n_revenue']}
+
+    with transaction.atomic():
+        for model in (DailySales, DailyMovieSales, DailyTheatreSales):
+            rows = model.objects.all()
+            if since:
+                rows = rows.filter(date__gte=since)
+            rows.delete()
+
+        days = DailySales.objects.bulk_create([
+            DailySales(created=row['n_created'], failed=row['n_failed'], **sold(row))
+            for row in _sold(bookings)
+        ])
+        DailyMovieSales.objects.bulk_create(
+            DailyMovieSales(movie_id=row['show__movie_id'], **sold(row))
+            for row in _sold(confirmed, 'show__movie_id')
+        )
+        DailyTheatreSales.objects.bulk_create(
+            DailyTheatreSales(theatre_id=row['show__screen__theatre_id'], **sold(row))
+            for row in _sold(confirmed, 'show__screen__theatre_id')
+        )
+    return len(days)
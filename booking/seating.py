@@ -0,0 +1,69 @@
+"""
+Seat generation for new shows.
+
+Every show on a screen gets the same seats, so each screen's layout is
+read from its ``Seat`` rows once and cached in the ``layouts`` catalogue
+namespace (bumped whenever a Seat or Screen changes). Shows without seats
+are found with one anti-join, and their seats are written with
+``bulk_create``. ``bulk_create`` skips ``ShowSeat.save()``, so the
+availability counters are set here with one UPDATE per screen.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from bookmyseat.cache import cached
+
+from .models import Seat, Show, ShowSeat
+
+
+def screen_layout(screen_id):
+    """The screen's seats as a tuple of ``(row, number)`` pairs."""
+    return cached(('layouts',), f"screen:{screen_id}", lambda: tuple(
+        Seat.objects.filter(screen_id=screen_id).order_by('row', 'seat_number').values_list('row', 'seat_number')
+    ))
+
+
+def shows_without_seats(shows=None):
+    shows = Show.objects.all() if shows is None else shows
+    return shows.filter(~Exists(ShowSeat.objects.filter(show=OuterRef('pk'))))
+
+
+def create_show_seats(shows=None, batch_size=1000):
+    """
+    Create the seats of every show in ``shows`` that has none yet.
+
+    Returns ``(shows_filled, seats_created)``. Shows are written in
+    transactions of about ``batch_size`` seats.
+    """
+    pending = shows_without_seats(shows).order_by('date', 'time', 'id').values_list('id', 'screen_id')
+    layouts = {}
+    filled = created = 0
+    batch, per_screen = [], defaultdict(list)
+
+    def flush():
+        with transaction.atomic():
+            ShowSeat.objects.bulk_create(batch, batch_size=batch_size)
+            for screen_id, show_ids in per_screen.items():
+                Show.objects.filter(id__in=show_ids).update(
+                    seats_available=F('seats_available') + len(layouts[screen_id])
+                )
+        batch.clear()
+        per_screen.clear()
+
+    for show_id, screen_id in list(pending):
+        if screen_id not in layouts:
+            layouts[screen_id] = screen_layout(screen_id)
+        layout = layouts[screen_id]
+        if not layout:
+            continue
+        batch.extend(ShowSeat(show_id=show_id, row=row, number=number) for row, number in layout)
+        per_screen[screen_id].append(show_id)
+        filled += 1
+        created += len(layout)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return filled, created
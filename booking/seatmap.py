@@ -0,0 +1,209 @@
+"""
+Compact, cached seat state for a show.
+
+A ``SeatMap`` is built once from the show's ``ShowSeat`` rows and holds
+booked/held flags as packed bitsets plus per-seat hold expiry and holder
+arrays, all indexed by seat position (seats ordered by row, number).
+Maps are cached per process and keyed on ``Show.seat_version``, which
+every reserve, release and book transition bumps, so a stale map is
+never served once the new version has been read. Each seat also carries
+the version at which it last changed, which lets clients fetch deltas.
+Holds lapse without a version bump, so anything cached by version must
+also key on ``next_expiry``.
+"""
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+
+from .models import RESERVATION_TIMEOUT_MINUTES, ShowSeat
+
+
+AVAILABLE = 'available'
+BOOKED = 'booked'
+RESERVED_OTHER = 'reserved-other'
+RESERVED_YOU = 'reserved-you'
+
+HOLD_SECONDS = timedelta(minutes=RESERVATION_TIMEOUT_MINUTES).total_seconds()
+
+# Single-character state codes used by the JSON encoding.
+STATE_CODES = {AVAILABLE: '0', RESERVED_OTHER: '1', RESERVED_YOU: '2', BOOKED: '3'}
+
+SeatView = namedtuple('SeatView', 'id row number state expires')
+
+
+def _set_bit(bits, i):
+    bits[i >> 3] |= 1 << (i & 7)
+
+
+def _get_bit(bits, i):
+    return bits[i >> 3] >> (i & 7) & 1
+
+
+class SeatMap:
+    __slots__ = (
+        'show_id', 'version', 'ids', 'numbers', 'row_spans',
+        'booked', 'held', 'expires', 'holders', 'versions', '_positions',
+    )
+
+    def __init__(self, show_id, version, seats):
+        size = len(seats)
+        self.show_id = show_id
+        self.version = version
+        self.ids = array('q', [0]) * size
+        self.numbers = array('l', [0]) * size
+        self.row_spans = []
+        self.booked = bytearray((size + 7) // 8)
+        self.held = bytearray((size + 7) // 8)
+        self.expires = array('d', [0.0]) * size
+        self.holders = array('q', [0]) * size
+        self.versions = array('q', [0]) * size
+        self._positions = None
+
+        for i, (seat_id, row, number, is_booked, holder_id, reserved_at, version) in enumerate(seats):
+            self.ids[i] = seat_id
+            self.numbers[i] = number
+            self.versions[i] = version
+            if not self.row_spans or self.row_spans[-1][0] != row:
+                self.row_spans.append([row, i, i + 1])
+            else:
+                self.row_spans[-1][2] = i + 1
+            if is_booked:
+                _set_bit(self.booked, i)
+            elif holder_id and reserved_at:
+                _set_bit(self.held, i)
+                self.holders[i] = holder_id
+                self.expires[i] = reserved_at.timestamp() + HOLD_SECONDS
+
+    @classmethod
+    def build(cls, show_id, version):
+        seats = ShowSeat.objects.filter(show_id=show_id).order_by('row', 'number').values_list(
+            'id', 'row', 'number', 'is_booked', 'reserved_by_id', 'reserved_at', 'version'
+        )
+        return cls(show_id, version, list(seats))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, seat_id):
+        if self._positions is None:
+            self._positions = {seat_id: i for i, seat_id in enumerate(self.ids)}
+        return self._positions.get(seat_id)
+
+    def is_booked(self, i):
+        return bool(_get_bit(self.booked, i))
+
+    def is_held(self, i, now):
+        return bool(_get_bit(self.held, i)) and now < self.expires[i]
+
+    def state(self, i, now, user_id=None):
+        if _get_bit(self.booked, i):
+            return BOOKED
+        if self.is_held(i, now):
+            return RESERVED_YOU if user_id and self.holders[i] == user_id else RESERVED_OTHER
+        return AVAILABLE
+
+    def next_expiry(self, now=None):
+        """When the next live hold lapses, as a Unix timestamp, or 0 if none will."""
+        now = time.time() if now is None else now
+        upcoming = [
+            self.expires[i] for i in range(len(self))
+            if _get_bit(self.held, i) and self.expires[i] > now
+        ]
+        return int(min(upcoming)) if upcoming else 0
+
+    def _seat(self, i, now, user_id):
+        state = self.state(i, now, user_id)
+        expires = int(self.expires[i]) if state in (RESERVED_OTHER, RESERVED_YOU) else None
+        return state, expires
+
+    def rows(self, user_id=None, now=None):
+        now = time.time() if now is None else now
+        for row, start, end in self.row_spans:
+            yield row, [
+                SeatView(self.ids[i], row, self.numbers[i], *self._seat(i, now, user_id))
+                for i in range(start, end)
+            ]
+
+    def _seat_code(self, i, now, user_id):
+        state, expires = self._seat(i, now, user_id)
+        return STATE_CODES[state], expires
+
+    def encode(self, user_id=None, now=None):
+        now = time.time() if now is None else now
+        states = []
+        expires = {}
+        for i in range(len(self)):
+            code, expires_at = self._seat_code(i, now, user_id)
+            states.append(code)
+            if expires_at is not None:
+                expires[i] = expires_at
+        return {
+            'show': self.show_id,
+            'v': self.version,
+            'rows': self.row_spans,
+            'ids': self.ids.tolist(),
+            'numbers': self.numbers.tolist(),
+            'states': ''.join(states),
+            'expires': expires,
+        }
+
+    def encode_delta(self, since, user_id=None, now=None):
+        now = time.time() if now is None else now
+        changes = []
+        for i in range(len(self)):
+            if self.versions[i] > since:
+                code, expires_at = self._seat_code(i, now, user_id)
+                changes.append([self.ids[i], code, expires_at])
+        return {'show': self.show_id, 'v': self.version, 'since': since, 'changes': changes}
+
+    def counts(self, now=None):
+        now = time.time() if now is None else now
+        booked = held = 0
+        for i in range(len(self)):
+            if _get_bit(self.booked, i):
+                booked += 1
+            elif self.is_held(i, now):
+                held += 1
+        return {'available': len(self) - booked - held, 'held': held, 'booked': booked}
+
+
+class SeatMapCache:
+    """Bounded LRU of seat maps, one entry per show at its latest seen version."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, show_id, version):
+        with self._lock:
+            seat_map = self._maps.get(show_id)
+            if seat_map is not None and seat_map.version == version:
+                self._maps.move_to_end(show_id)
+                return seat_map
+
+        seat_map = SeatMap.build(show_id, version)
+
+        with self._lock:
+            current = self._maps.get(show_id)
+            if current is None or current.version <= version:
+                self._maps[show_id] = seat_map
+                self._maps.move_to_end(show_id)
+            while len(self._maps) > self.maxsize:
+                self._maps.popitem(last=False)
+        return seat_map
+
+    def clear(self):
+        with self._lock:
+            self._maps.clear()
+
+
+seat_map_cache = SeatMapCache(getattr(settings, 'SEAT_MAP_CACHE_SIZE', 256))
+
+
+def get_seat_map(show):
+    return seat_map_cache.get(show.id, show.seat_version)
@@ -0,0 +1,67 @@
+"""
+Upcoming showtimes for a movie, grouped for the movie page.
+
+One query fetches the movie's upcoming shows with their screen and
+theatre; available seats come from the show's own counter, plus any
+holds that have lapsed but not been released yet. The result is
+grouped by city, theatre and date and cached per movie in the
+``showtimes`` catalogue namespace, which any Show, Screen or Theatre
+change invalidates. Seat counts move with every booking without touching
+that namespace, so the entry is only kept for ``SHOWTIMES_CACHE_TIMEOUT``
+seconds.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from bookmyseat.cache import cached
+
+from .models import Show
+
+
+def showtimes_timeout():
+    return getattr(settings, 'SHOWTIMES_CACHE_TIMEOUT', 30)
+
+
+def upcoming_shows(movie_id, now=None):
+    now = timezone.localtime(now)
+    return (
+        Show.objects.filter(movie_id=movie_id)
+        .filter(Q(date__gt=now.date()) | Q(date=now.date(), time__gte=now.time()))
+        .with_lapsed_holds(now)
+        .select_related('screen__theatre')
+        .order_by('screen__theatre__city', 'screen__theatre__name', 'screen__theatre_id', 'date', 'time', 'id')
+    )
+
+
+def group_showtimes(shows):
+    """Nest shows (ordered by city, theatre, date, time) as cities > theatres > dates > shows."""
+    cities = []
+    for show in shows:
+        theatre = show.screen.theatre
+        if not cities or cities[-1]['city'] != theatre.city:
+            cities.append({'city': theatre.city, 'theatres': []})
+        theatres = cities[-1]['theatres']
+        if not theatres or theatres[-1]['id'] != theatre.id:
+            theatres.append({'id': theatre.id, 'name': theatre.name, 'address': theatre.address, 'dates': []})
+        dates = theatres[-1]['dates']
+        if not dates or dates[-1]['date'] != show.date:
+            dates.append({'date': show.date, 'shows': []})
+        dates[-1]['shows'].append({
+            'id': show.id,
+            'time': show.time,
+            'price': show.price,
+            'screen': show.screen.screen_number,
+            'seats_available': show.seats_available + show.lapsed_holds,
+            # A show whose seats have not been created yet is not sold out.
+            'on_sale': bool(show.seats_available or show.seats_held or show.seats_booked),
+        })
+    return cities
+
+
+def movie_showtimes(movie_id):
+    return cached(
+        ('showtimes',), f"movie:{movie_id}",
+        lambda: group_showtimes(upcoming_shows(movie_id)),
+        showtimes_timeout(),
+    )
@@ -1,9 +1,10 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
 from movies.models import Movie
-from booking.models import Theatre, Screen, Seat, Show, ShowSeat, Booking
+from booking.models import Theatre, Screen, Seat, Show, ShowSeat, Booking, SeatUnavailable, RESERVATION_TIMEOUT_MINUTES
 from datetime import date, time, timedelta
 from django.utils import timezone
+from django.test import override_settings
 
 class MovieFilterTestCase(TestCase):
     def setUp(self):
@@ -33,6 +34,82 @@ class MovieFilterTestCase(TestCase):
         response = movie_list(request)
         self.assertEqual(response.status_code, 200)
 
+    def test_search_ranks_prefix_matches(self):
+        from movies.search import search_movies
+
+        self.movie2.description = "A funny comedy with some action"
+        self.movie2.save()
+        results = list(search_movies(Movie.objects.all(), "act"))
+        self.assertEqual(results, [self.movie1, self.movie2])
+        self.assertEqual(list(search_movies(Movie.objects.all(), "actor c")), [self.movie2])
+        self.assertEqual(list(search_movies(Movie.objects.all(), "ACTION packed")), [self.movie1])
+
+    def test_search_index_follows_writes(self):
+        from movies.search import search_movies
+
+        self.movie1.name = "Heist Movie"
+        self.movie1.save()
+        self.assertEqual(list(search_movies(Movie.objects.all(), "heist")), [self.movie1])
+        self.movie1.delete()
+        self.assertEqual(list(search_movies(Movie.objects.all(), "heist")), [])
+
+    def test_genre_filter_uses_normalised_key(self):
+        self.assertEqual(self.movie1.genre_key, 'action')
+        Movie.objects.update(image='movies/poster.jpg')
+        response = self.client.get('/movies/', {'genre': ' ACTION '})
+        self.assertEqual(list(response.context['movies']), [self.movie1])
+
+    def test_facet_counts_are_cached_until_a_movie_changes(self):
+        from movies.facets import facet_counts
+
+        facet_counts()
+        with self.assertNumQueries(0):
+            facets = facet_counts()
+        self.assertEqual(facets['language'], [
+            {'key': 'english', 'label': 'English', 'count': 1},
+            {'key': 'hindi', 'label': 'Hindi', 'count': 1},
+        ])
+
+        self.movie2.language = "english"
+        self.movie2.save()
+        self.assertEqual([(f['key'], f['count']) for f in facet_counts()['language']], [('english', 2)])
+
+    def test_keyset_pages_walk_forward_and_back(self):
+        from bookmyseat.pagination import keyset_paginate
+
+        movies = [self.movie1, self.movie2] + [
+            Movie.objects.create(name=f"Movie {i}", rating=3, cast="Cast", genre="Drama", language="Tamil")
+            for i in range(3)
+        ]
+        first = keyset_paginate(Movie.objects.all(), ('-rating', 'id'), per_page=2)
+        self.assertEqual(list(first), [self.movie1, self.movie2])
+        self.assertFalse(first.has_previous)
+
+        second = keyset_paginate(Movie.objects.all(), ('-rating', 'id'), first.next_cursor, per_page=2)
+        self.assertEqual(list(second), movies[2:4])
+        third = keyset_paginate(Movie.objects.all(), ('-rating', 'id'), second.next_cursor, per_page=2)
+        self.assertEqual((list(third), third.has_next), (movies[4:], False))
+
+        back = keyset_paginate(Movie.objects.all(), ('-rating', 'id'), third.previous_cursor, per_page=2)
+        self.assertEqual(list(back), movies[2:4])
+        self.assertEqual(back.next_cursor, second.next_cursor)
+
+    def test_mistyped_cursor_values_are_invalid(self):
+        from bookmyseat.pagination import InvalidCursor, encode_cursor, keyset_paginate
+
+        for values in (['abc'], [None], [[1]], [{'id': 1}]):
+            with self.subTest(values=values), self.assertRaises(InvalidCursor):
+                keyset_paginate(Movie.objects.all(), ('id',), encode_cursor(values))
+
+    def test_search_falls_back_to_unranked_matches(self):
+        from unittest import mock
+        from movies.search import search_movies
+
+        with mock.patch('movies.search.connection') as connection:
+            connection.vendor = 'mysql'
+            movies = search_movies(Movie.objects.all(), 'action')
+        self.assertEqual([(m, m.search_rank) for m in movies], [(self.movie1, 0.0)])
+
     def test_genre_filter(self):
         from movies.views import movie_list
         from django.test import RequestFactory
@@ -52,6 +129,107 @@ class MovieFilterTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class CatalogueCacheTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.movie = Movie.objects.create(
+            name="Cached Movie", image='movies/poster.jpg', rating=4.0, cast="Cast",
+            genre="Drama", language="English"
+        )
+
+    def test_anonymous_page_is_cached_until_a_movie_changes(self):
+        self.assertContains(self.client.get('/movies/'), "Cached Movie")
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get('/movies/'), "Cached Movie")
+
+        self.movie.name = "Renamed Movie"
+        self.movie.save()
+        self.assertContains(self.client.get('/movies/'), "Renamed Movie")
+
+    def test_show_changes_invalidate_movie_detail(self):
+        url = f'/movies/{self.movie.id}/'
+        self.assertContains(self.client.get(url), "Cached Movie")
+        theatre = Theatre.objects.create(name="Fresh Theatre", city="Pune", address="Road")
+        screen = Screen.objects.create(theatre=theatre, screen_number=1, total_seats=10)
+        Show.objects.create(movie=self.movie, screen=screen, date=date.today() + timedelta(days=1), time=time(18, 0), price=150)
+        self.assertContains(self.client.get(url), "Fresh Theatre")
+
+    def test_showtimes_are_upcoming_grouped_and_counted_in_one_query(self):
+        from booking.showtimes import upcoming_shows, group_showtimes
+
+        now = timezone.localtime()
+        tomorrow = now.date() + timedelta(days=1)
+        pune = Theatre.objects.create(name="Alpha", city="Pune", address="Road")
+        mumbai = Theatre.objects.create(name="Beta", city="Mumbai", address="Street")
+        shows = [
+            Show.objects.create(movie=self.movie, screen=Screen.objects.create(theatre=theatre, screen_number=1, total_seats=2),
+                                date=day, time=time(18, 0), price=150)
+            for theatre, day in ((pune, tomorrow), (mumbai, tomorrow), (pune, now.date() - timedelta(days=1)))
+        ]
+        ShowSeat.objects.create(show=shows[0], row="A", number=1, is_booked=True)
+        ShowSeat.objects.create(show=shows[0], row="A", number=2)
+        user = User.objects.create_user(username='holder', password='testpass123')
+        ShowSeat.objects.create(show=shows[1], row="A", number=1, reserved_by=user, reserved_at=timezone.now())
+        ShowSeat.objects.create(show=shows[1], row="A", number=2, reserved_by=user, reserved_at=now - timedelta(minutes=10))
+
+        with self.assertNumQueries(1):
+            cities = group_showtimes(upcoming_shows(self.movie.id))
+
+        self.assertEqual([city['city'] for city in cities], ["Mumbai", "Pune"])
+        pune_shows = cities[1]['theatres'][0]['dates'][0]['shows']
+        self.assertEqual([(s['id'], s['seats_available'], s['on_sale']) for s in pune_shows], [(shows[0].id, 1, True)])
+        # The lapsed hold is back on sale before the releaser gets to it.
+        self.assertEqual(cities[0]['theatres'][0]['dates'][0]['shows'][0]['seats_available'], 1)
+
+    def test_show_without_seats_is_not_on_sale_rather_than_sold_out(self):
+        from booking.showtimes import upcoming_shows, group_showtimes
+
+        theatre = Theatre.objects.create(name="Alpha", city="Pune", address="Road")
+        screen = Screen.objects.create(theatre=theatre, screen_number=1, total_seats=1)
+        empty, sold_out = [
+            Show.objects.create(movie=self.movie, screen=screen, date=date.today() + timedelta(days=1), time=time(hour, 0), price=150)
+            for hour in (12, 18)
+        ]
+        ShowSeat.objects.create(show=sold_out, row="A", number=1, is_booked=True)
+
+        shows = group_showtimes(upcoming_shows(self.movie.id))[0]['theatres'][0]['dates'][0]['shows']
+        self.assertEqual(
+            [(s['id'], s['seats_available'], s['on_sale']) for s in shows],
+            [(empty.id, 0, False), (sold_out.id, 0, True)],
+        )
+
+    def test_stale_value_is_served_while_another_caller_rebuilds(self):
+        from bookmyseat.cache import bump, cached, get_cache
+
+        self.assertEqual(cached(('movies',), 'probe', lambda: 'old'), 'old')
+        bump('movies')
+        get_cache().add('catalogue:movies:probe:lock', True)
+        self.assertEqual(cached(('movies',), 'probe', lambda: 'new'), 'old')
+        get_cache().delete('catalogue:movies:probe:lock')
+        self.assertEqual(cached(('movies',), 'probe', lambda: 'new'), 'new')
+
+    def test_cold_miss_waits_for_the_caller_holding_the_lock(self):
+        import threading
+        import time as clock
+        from bookmyseat.cache import cached
+
+        building = threading.Event()
+
+        def slow_build():
+            building.set()
+            clock.sleep(0.2)
+            return 'first'
+
+        other = threading.Thread(target=cached, args=(('movies',), 'cold', slow_build))
+        other.start()
+        building.wait()
+        try:
+            self.assertEqual(cached(('movies',), 'cold', lambda: 'second'), 'first')
+        finally:
+            other.join()
+
+
 class SeatReservationTestCase(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -120,6 +298,993 @@ class SeatReservationTestCase(TestCase):
         self.assertFalse(self.seat.is_reserved)
 
 
+class ShowTestCase(TestCase):
+    """One show of a movie, today, on a screen of ``total_seats`` seats (none created)."""
+    total_seats = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(name="Test Movie", rating=4.5, cast="Test Cast")
+        cls.theatre = Theatre.objects.create(name="Test Theatre", city="Test City", address="Test Address")
+        cls.screen = Screen.objects.create(theatre=cls.theatre, screen_number=1, total_seats=cls.total_seats)
+        cls.show = Show.objects.create(
+            movie=cls.movie, screen=cls.screen, date=date.today(), time=time(14, 0), price=200
+        )
+
+
+class LazyExpiryTestCase(ShowTestCase):
+    total_seats = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='holder', password='testpass123')
+        now = timezone.now()
+        self.free = ShowSeat.objects.create(show=self.show, row="A", number=1)
+        self.held = ShowSeat.objects.create(
+            show=self.show, row="A", number=2, reserved_by=self.user, reserved_at=now
+        )
+        self.stale = ShowSeat.objects.create(
+            show=self.show, row="A", number=3, reserved_by=self.user,
+            reserved_at=now - timedelta(minutes=10)
+        )
+
+    def test_querysets_match_is_reserved(self):
+        seats = ShowSeat.objects.filter(show=self.show)
+        self.assertEqual(list(seats.held()), [self.held])
+        self.assertEqual(list(seats.expired()), [self.stale])
+        self.assertEqual(set(seats.available()), {self.free, self.stale})
+        for seat in seats:
+            self.assertEqual(seat.is_reserved, seat in set(seats.held()))
+
+    def test_release_expired_is_set_based(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            released = ShowSeat.objects.filter(show=self.show).release_expired()
+        self.assertEqual(released, 1)
+        updates = [q['sql'].split()[1] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(updates, ['"booking_showseat"', '"booking_show"'])
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held), (2, 1))
+        self.stale.refresh_from_db()
+        self.assertIsNone(self.stale.reserved_by)
+        self.held.refresh_from_db()
+        self.assertEqual(self.held.reserved_by, self.user)
+
+    def test_sweep_racing_a_claim_keeps_counters_exact(self):
+        from unittest import mock
+        from booking.models import ShowSeatQuerySet
+
+        other = User.objects.create_user(username='other', password='testpass123')
+        expired = ShowSeatQuerySet.expired
+        calls = []
+
+        def racing(queryset, now=None):
+            # The claim lands after the sweep picked its shows, before it releases.
+            calls.append(now)
+            if len(calls) == 2:
+                ShowSeat.objects.claim(self.show, [self.stale.id], other)
+            return expired(queryset, now)
+
+        with mock.patch.object(ShowSeatQuerySet, 'expired', racing):
+            self.assertEqual(ShowSeat.objects.release_expired(), 0)
+
+        self.stale.refresh_from_db()
+        self.assertEqual(self.stale.reserved_by, other)
+        show = Show.objects.with_seat_recount().get(pk=self.show.pk)
+        self.assertEqual((show.seats_available, show.seats_held), (show.actual_available, show.actual_held))
+        self.assertEqual((show.seats_available, show.seats_held), (1, 2))
+
+    def test_release_command_sweeps_in_chunks(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        stale_at = timezone.now() - timedelta(minutes=10)
+        for number in range(4, 9):
+            ShowSeat.objects.create(show=self.show, row="B", number=number, reserved_by=self.user, reserved_at=stale_at)
+
+        out = StringIO()
+        call_command('release_expired_reservations', '--dry-run', stdout=out)
+        self.assertIn(f"Would release 6 expired reservations across 1 show(s)", out.getvalue())
+        self.assertEqual(ShowSeat.objects.expired().count(), 6)
+
+        out = StringIO()
+        call_command('release_expired_reservations', '--chunk-size', '4', stdout=out)
+        self.assertIn(f"Show {self.show.id} (Test Movie", out.getvalue())
+        self.assertIn("Released 6 expired reservations", out.getvalue())
+        self.assertFalse(ShowSeat.objects.expired().exists())
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held), (7, 1))
+
+    def test_next_expiry_is_the_oldest_live_hold(self):
+        self.assertEqual(
+            ShowSeat.objects.next_expiry(),
+            self.held.reserved_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
+        )
+
+    def test_timer_wheel_fires_in_deadline_order_across_levels(self):
+        from booking.expiry import TimerWheel
+
+        wheel = TimerWheel(tick=1, slots=4, levels=2, now=0)
+        for deadline in (40, 3, 17, 5.5, 16):
+            wheel.schedule(deadline, deadline)
+        self.assertEqual(len(wheel), 5)
+        self.assertEqual(wheel.advance(5), [3])
+        self.assertEqual(wheel.advance(16), [5.5, 16])
+        self.assertEqual(wheel.advance(39), [17])
+        self.assertEqual(wheel.advance(100), [40])
+        self.assertEqual(len(wheel), 0)
+
+    def test_scheduler_releases_due_holds_per_show(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from booking.expiry import HoldExpiryScheduler
+
+        scheduler = HoldExpiryScheduler()
+        scheduler.rebuild()
+        self.assertEqual(len(scheduler.wheel), 2)
+
+        # The lapsed hold is re-claimed before its tick comes round.
+        retaken_at = timezone.now()
+        ShowSeat.objects.claim(self.show, [self.stale.id], self.user, now=retaken_at)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(scheduler.tick(timezone.now() + timedelta(seconds=2)), 0)
+        # Nothing is still lapsed, so neither the seats nor the show are written.
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(updates, [])
+
+        scheduler.sync()
+        later = retaken_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES, seconds=2)
+        self.assertEqual(scheduler.tick(later), 2)
+        self.assertFalse(ShowSeat.objects.filter(reserved_by__isnull=False).exists())
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held), (3, 0))
+
+    def test_scheduler_only_acts_while_leading(self):
+        from booking.expiry import HoldExpiryScheduler, LEADER_KEY
+        from django.core.cache import cache
+
+        first, second = HoldExpiryScheduler(), HoldExpiryScheduler()
+        self.addCleanup(cache.delete, LEADER_KEY)
+        first.step()
+        second.step()
+        self.assertTrue(first.is_leader)
+        self.assertFalse(second.is_leader)
+        self.assertEqual(len(second.wheel), 0)
+        second.schedule(self.show.id, [self.free.id], timezone.now())
+        self.assertEqual(len(second.wheel), 0)
+        first.tick(timezone.now() + timedelta(seconds=2))
+        self.stale.refresh_from_db()
+        self.assertIsNone(self.stale.reserved_by)
+
+    def test_lease_is_renewed_without_overwriting_a_new_holder(self):
+        from unittest import mock
+        from booking.expiry import HoldExpiryScheduler, LEADER_KEY
+        from django.core.cache import cache
+
+        scheduler = HoldExpiryScheduler()
+        self.addCleanup(cache.delete, LEADER_KEY)
+        self.assertTrue(scheduler.elect())
+        self.assertTrue(scheduler.elect())
+
+        # The lease lapses and another worker takes it between the read and the renewal.
+        real_touch = cache.touch
+
+        def lapse_then_touch(key, timeout):
+            cache.set(LEADER_KEY, 'elsewhere', timeout)
+            return real_touch(key, timeout)
+
+        with mock.patch.object(cache, 'touch', side_effect=lapse_then_touch):
+            self.assertFalse(scheduler.elect())
+        self.assertEqual(cache.get(LEADER_KEY), 'elsewhere')
+
+    def test_scheduler_with_process_local_cache_is_flagged(self):
+        import tempfile
+        from booking.expiry import check_leader_cache
+
+        with override_settings(HOLD_EXPIRY_SCHEDULER=True):
+            self.assertEqual([w.id for w in check_leader_cache(None)], ['booking.W001'])
+            shared = {'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.enterContext(tempfile.TemporaryDirectory()),
+            }}
+            with override_settings(CACHES=shared):
+                self.assertEqual(check_leader_cache(None), [])
+        self.assertEqual(check_leader_cache(None), [])
+
+    def test_interrupted_scheduler_releases_its_lease(self):
+        from unittest import mock
+        from booking.expiry import HoldExpiryScheduler, LEADER_KEY
+        from django.core.cache import cache
+
+        scheduler = HoldExpiryScheduler()
+        self.addCleanup(cache.delete, LEADER_KEY)
+        scheduler.step()
+        self.assertEqual(cache.get(LEADER_KEY), scheduler.identity)
+
+        with mock.patch.object(scheduler, 'step', side_effect=KeyboardInterrupt):
+            scheduler.run()
+        self.assertIsNone(cache.get(LEADER_KEY))
+
+    def test_seat_map_get_never_writes(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/booking/select-seats/{self.show.id}/')
+        self.assertEqual(response.status_code, 200)
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "booking_showseat"')]
+        self.assertEqual(writes, [])
+        self.stale.refresh_from_db()
+        self.assertIsNotNone(self.stale.reserved_at)
+
+
+class SeatMapTestCase(ShowTestCase):
+    total_seats = 4
+
+    def setUp(self):
+        from booking.seatmap import seat_map_cache
+
+        seat_map_cache.clear()
+        self.user = User.objects.create_user(username='holder', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        now = timezone.now()
+        ShowSeat.objects.create(show=self.show, row="A", number=1, is_booked=True)
+        self.mine = ShowSeat.objects.create(
+            show=self.show, row="A", number=2, reserved_by=self.user, reserved_at=now
+        )
+        ShowSeat.objects.create(
+            show=self.show, row="B", number=1, reserved_by=self.other,
+            reserved_at=now - timedelta(minutes=10)
+        )
+        ShowSeat.objects.create(show=self.show, row="B", number=2, reserved_by=self.other, reserved_at=now)
+
+    def test_states_by_row(self):
+        from booking.seatmap import get_seat_map
+
+        rows = list(get_seat_map(self.show).rows(self.user.id))
+        self.assertEqual([row for row, _ in rows], ["A", "B"])
+        self.assertEqual(
+            [[seat.state for seat in seats] for _, seats in rows],
+            [["booked", "reserved-you"], ["available", "reserved-other"]],
+        )
+        self.assertEqual(get_seat_map(self.show).counts(), {'available': 1, 'held': 2, 'booked': 1})
+
+    def test_cached_until_version_bump(self):
+        from booking.seatmap import get_seat_map
+
+        seat_map = get_seat_map(self.show)
+        with self.assertNumQueries(0):
+            self.assertIs(get_seat_map(self.show), seat_map)
+
+        self.mine.release()
+        self.show.refresh_from_db()
+        self.assertEqual(self.show.seat_version, 1)
+        rebuilt = get_seat_map(self.show)
+        self.assertIsNot(rebuilt, seat_map)
+        self.assertEqual(rebuilt.counts()['available'], 2)
+
+    def test_json_seat_map_etag_and_delta(self):
+        self.client.force_login(self.user)
+        url = f'/booking/seat-map/{self.show.id}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['states'], '3201')
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.mine.release()
+        response = self.client.get(url, {'since': 0}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['changes'], [[self.mine.id, '0', None]])
+
+    def test_etag_changes_when_a_hold_lapses(self):
+        import time as clock
+        from unittest import mock
+        from booking.seatmap import get_seat_map
+
+        self.client.force_login(self.user)
+        url = f'/booking/seat-map/{self.show.id}/'
+        etag = self.client.get(url)['ETag']
+        expiry = get_seat_map(self.show).next_expiry()
+        self.assertGreater(expiry, clock.time())
+
+        with mock.patch('booking.seatmap.time.time', return_value=expiry + 1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['states'], '3000')
+
+
+class SeatClaimTestCase(ShowTestCase):
+    total_seats = 4
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        now = timezone.now()
+        self.free = ShowSeat.objects.create(show=self.show, row="A", number=1)
+        self.expired = ShowSeat.objects.create(
+            show=self.show, row="A", number=2, reserved_by=self.other,
+            reserved_at=now - timedelta(minutes=10)
+        )
+        self.own = ShowSeat.objects.create(show=self.show, row="A", number=3, reserved_by=self.user, reserved_at=now)
+        self.taken = ShowSeat.objects.create(show=self.show, row="A", number=4, reserved_by=self.other, reserved_at=now)
+
+    def test_claims_free_expired_and_own_seats(self):
+        seat_ids = [self.free.id, self.expired.id, self.own.id]
+        claimed = ShowSeat.objects.claim(self.show, seat_ids, self.user)
+
+        self.assertEqual(claimed, sorted(seat_ids))
+        for seat in ShowSeat.objects.filter(id__in=seat_ids):
+            self.assertEqual(seat.reserved_by, self.user)
+            self.assertTrue(seat.is_reserved)
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held), (0, 4))
+
+    def test_conflict_rolls_back_and_names_seats(self):
+        with self.assertRaises(SeatUnavailable) as ctx:
+            ShowSeat.objects.claim(self.show, [self.free.id, self.taken.id, 999999], self.user)
+
+        self.assertEqual(ctx.exception.seats, [self.taken])
+        self.assertEqual(ctx.exception.missing, [999999])
+        self.free.refresh_from_db()
+        self.assertIsNone(self.free.reserved_by)
+        self.show.refresh_from_db()
+        self.assertEqual(self.show.seat_version, 0)
+
+    def test_houseful_show_is_rejected_before_claiming(self):
+        ShowSeat.objects.filter(show=self.show).update(is_booked=True, reserved_by=None, reserved_at=None)
+        Show.objects.filter(pk=self.show.pk).recount_seats()
+        self.client.force_login(self.user)
+        with self.assertNumQueries(3):  # session, user, show
+            response = self.client.post(f'/booking/select-seats/{self.show.id}/', {'seats': [self.free.id]})
+        self.assertRedirects(response, f'/movies/{self.show.movie_id}/', fetch_redirect_response=False)
+
+    def test_saving_an_existing_seat_moves_counters(self):
+        seat = ShowSeat.objects.get(pk=self.free.pk)
+        seat.is_booked = True
+        seat.save()
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held, self.show.seats_booked), (0, 3, 1))
+
+        # A stale copy still moves the counters by what is stored.
+        stale = ShowSeat.objects.get(pk=self.taken.pk)
+        ShowSeat.objects.get(pk=self.taken.pk).release()
+        stale.row = "Z"
+        stale.save()
+        show = Show.objects.with_seat_recount().get(pk=self.show.pk)
+        self.assertEqual(
+            (show.seats_available, show.seats_held, show.seats_booked),
+            (show.actual_available, show.actual_held, show.actual_booked),
+        )
+
+    def test_queryset_deletes_adjust_counters(self):
+        ShowSeat.objects.filter(id__in=[self.free.id, self.taken.id]).delete()
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held), (0, 2))
+
+    def test_repair_command_fixes_drifted_counters(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        Show.objects.filter(pk=self.show.pk).update(seats_available=40, seats_held=0)
+        out = StringIO()
+        call_command('repair_seat_counters', stdout=out)
+        self.assertIn(f"Show {self.show.id}: 40/0/0 -> 1/3/0", out.getvalue())
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held, self.show.seats_booked), (1, 3, 0))
+
+    def test_create_show_seats_fills_only_empty_shows_in_bulk(self):
+        from io import StringIO
+        from django.core.cache import cache
+        from django.core.management import call_command
+
+        cache.clear()
+        for row in "AB":
+            for number in (1, 2, 3):
+                Seat.objects.create(screen=self.screen, row=row, seat_number=number)
+        empty = [
+            Show.objects.create(movie=self.movie, screen=self.screen, date=date.today() + timedelta(days=d), time=time(14, 0), price=200)
+            for d in (1, 2)
+        ]
+
+        out = StringIO()
+        # Anti-join, layout, then one transaction with a bulk INSERT and a counter UPDATE.
+        with self.assertNumQueries(6):
+            call_command('create_show_seats', '--batch-size', '12', stdout=out)
+        self.assertIn("Created 12 seats for 2 show(s)", out.getvalue())
+        self.assertEqual(ShowSeat.objects.filter(show=self.show).count(), 4)
+        for show in empty:
+            show.refresh_from_db()
+            self.assertEqual(show.seats_available, 6)
+            self.assertEqual([str(seat) for seat in show.seats.order_by('row', 'number')][:4], ["A1", "A2", "A3", "B1"])
+
+        call_command('create_show_seats', stdout=out)
+        self.assertIn("All shows already have seats.", out.getvalue())
+
+    def test_select_seats_post_reports_conflict(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            f'/booking/select-seats/{self.show.id}/', {'seats': [self.free.id, self.taken.id]}
+        )
+        self.assertRedirects(response, f'/booking/select-seats/{self.show.id}/')
+        self.assertFalse(Booking.objects.exists())
+
+
+@override_settings(PAYMENT_GATEWAY='booking.gateway.FakeGateway')
+class TwoPhaseBookingTestCase(ShowTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.seats = [ShowSeat.objects.create(show=self.show, row="A", number=n) for n in (1, 2)]
+        self.url = f'/booking/select-seats/{self.show.id}/'
+        self.client.force_login(self.user)
+
+    def test_order_created_after_hold_commits(self):
+        response = self.client.post(self.url, {'seats': [seat.id for seat in self.seats]})
+
+        self.assertEqual(response.status_code, 200)
+        booking = Booking.objects.get()
+        self.assertEqual(booking.status, 'PENDING')
+        self.assertEqual(booking.total_amount, 400)
+        self.assertTrue(booking.razorpay_order_id.startswith('order_fake'))
+        self.assertEqual(ShowSeat.objects.filter(reserved_by=self.user).count(), 2)
+
+    @override_settings(PAYMENT_GATEWAY_OPTIONS={'failure_rate': 1.0, 'max_retries': 0})
+    def test_gateway_failure_releases_hold(self):
+        response = self.client.post(self.url, {'seats': [seat.id for seat in self.seats]})
+
+        self.assertRedirects(response, self.url)
+        self.assertEqual(Booking.objects.get().status, 'FAILED')
+        self.assertFalse(ShowSeat.objects.filter(reserved_by__isnull=False).exists())
+
+
+@override_settings(PAYMENT_GATEWAY='booking.gateway.FakeGateway', RAZORPAY_WEBHOOK_SECRET='whsec')
+class PaymentConfirmationTestCase(ShowTestCase):
+    def setUp(self):
+        import tempfile
+        from django.core.cache import cache
+        self.enterContext(override_settings(TICKET_IMAGE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.enterContext(override_settings(DASHBOARD_BACKGROUND_REFRESH=False))
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpass123')
+        seat_ids = [ShowSeat.objects.create(show=self.show, row="A", number=n).id for n in (1, 2)]
+        ShowSeat.objects.claim(self.show, seat_ids, self.user)
+        self.booking = Booking.objects.create(
+            user=self.user, show=self.show, total_amount=400, razorpay_order_id='order_fake123'
+        )
+        self.booking.seats.set(seat_ids)
+
+    def _webhook(self, event='payment.captured', payment_id='pay_1', signature=None):
+        import json
+        from booking.gateway import get_gateway
+
+        body = json.dumps({
+            'event': event,
+            'payload': {'payment': {'entity': {'id': payment_id, 'order_id': 'order_fake123'}}},
+        }).encode()
+        return self.client.post(
+            '/booking/payment/webhook/', body, content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=signature or get_gateway().sign_webhook(body),
+        )
+
+    def test_webhook_confirms_once(self):
+        response = self._webhook()
+        self.assertEqual(response.json()['status'], 'ok')
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.razorpay_payment_id), ('CONFIRMED', 'pay_1'))
+        self.assertEqual(ShowSeat.objects.filter(is_booked=True).count(), 2)
+
+        self.assertEqual(self._webhook().json()['status'], 'duplicate')
+        self.assertEqual(self._webhook(event='order.paid').json()['status'], 'duplicate')
+
+    def test_webhook_failure_rolls_back_the_event(self):
+        from unittest import mock
+        from booking.models import PaymentEvent
+
+        self.client.raise_request_exception = False
+        with mock.patch('booking.views.record_booking_confirmed', side_effect=RuntimeError("db down")):
+            self.assertEqual(self._webhook().status_code, 500)
+        self.assertFalse(PaymentEvent.objects.exists())
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'PENDING')
+
+        self.assertEqual(self._webhook().json()['status'], 'ok')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'CONFIRMED')
+
+    def test_sales_rollups_follow_bookings_and_match_backfill(self):
+        from booking.models import DailySales, DailyMovieSales, DailyTheatreSales
+        from booking.rollups import rebuild_rollups, record_booking_created
+        from booking.views import fail_booking
+
+        failed = Booking.objects.create(user=self.user, show=self.show, total_amount=200)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            record_booking_created(self.booking)
+            record_booking_created(failed)
+            self.assertFalse(DailySales.objects.exists())
+        self.assertEqual(len(callbacks), 2)
+        fail_booking(failed)
+        self._webhook()
+        self._webhook()
+
+        def snapshot():
+            return (
+                list(DailySales.objects.values_list('date', 'created', 'failed', 'bookings', 'tickets_sold', 'revenue')),
+                list(DailyMovieSales.objects.values_list('movie_id', 'bookings', 'tickets_sold', 'revenue')),
+                list(DailyTheatreSales.objects.values_list('theatre_id', 'bookings', 'tickets_sold', 'revenue')),
+            )
+
+        live = snapshot()
+        self.assertEqual(live[0], [(timezone.localdate(), 2, 1, 1, 2, 400)])
+        self.assertEqual(live[1], [(self.show.movie_id, 1, 2, 400)])
+        self.assertEqual(rebuild_rollups(), 1)
+        self.assertEqual(snapshot(), live)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.client.force_login(self.user)
+        context = self.client.get('/dashboard/').context
+        self.assertEqual((context['total_revenue'], context['total_tickets_sold']), (400, 2))
+        self.assertEqual((context['pending_bookings'], context['failed_bookings']), (0, 1))
+        self.assertEqual(context['popular_movies'][0]['movie__name'], "Test Movie")
+
+    def test_confirm_books_held_seats_in_one_update(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.booking.confirm_seats(), 2)
+        seat_updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "booking_showseat"')]
+        self.assertEqual(len(seat_updates), 1)
+        self.assertEqual(ShowSeat.objects.filter(is_booked=True, reserved_by__isnull=True).count(), 2)
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held, self.show.seats_booked), (0, 0, 2))
+
+    def test_partial_confirm_books_nothing_and_flags_a_refund(self):
+        from booking.models import OutboundEmail
+
+        other = User.objects.create_user(username='other', password='testpass123')
+        lost = self.booking.seats.first()
+        ShowSeat.objects.filter(pk=lost.pk).update(reserved_by=other)
+
+        with self.assertLogs('booking.views', 'ERROR'):
+            self._webhook()
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.is_paid), ('REFUND', True))
+        self.assertFalse(ShowSeat.objects.filter(is_booked=True).exists())
+        self.assertEqual(ShowSeat.objects.filter(reserved_by=other).count(), 1)
+        self.assertFalse(ShowSeat.objects.filter(reserved_by=self.user).exists())
+        self.show.refresh_from_db()
+        self.assertEqual(self.show.seats_booked, 0)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_transitions_skip_seats_held_by_someone_else(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        lost = self.booking.seats.first()
+        ShowSeat.objects.filter(pk=lost.pk).update(reserved_by=other)
+
+        self.assertEqual(self.booking.confirm_seats(), 1)
+        lost.refresh_from_db()
+        self.assertFalse(lost.is_booked)
+        self.assertEqual(lost.reserved_by, other)
+
+    def test_confirmation_email_is_queued_then_drained(self):
+        from django.core import mail
+        from booking.models import OutboundEmail
+        from booking.outbox import drain
+
+        self._webhook()
+        self.assertEqual(len(mail.outbox), 0)
+        entry = OutboundEmail.objects.get()
+        self.assertEqual((entry.booking, entry.recipient, entry.status), (self.booking, 'buyer@example.com', 'PENDING'))
+
+        self.assertEqual(drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(self.booking.ticket_reference, mail.outbox[0].body)
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('SENT', 1))
+        self.assertEqual(drain(), (0, 0))
+
+    def test_confirmation_email_is_sent_inline_without_background_threads(self):
+        from django.core import mail
+        from booking.models import OutboundEmail
+
+        with override_settings(EMAIL_OUTBOX_EAGER=True, BACKGROUND_THREADS=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                self._webhook()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, 'SENT')
+
+    def test_cron_endpoint_drains_outbox_with_secret_only(self):
+        from django.core import mail
+
+        with override_settings(EMAIL_OUTBOX_EAGER=False):
+            self._webhook()
+        url = '/booking/cron/send-queued-emails/'
+        with override_settings(CRON_SECRET=''):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        with override_settings(CRON_SECRET='s3cret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(len(mail.outbox), 0)
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.json(), {'sent': 1, 'failed': 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_confirmation_email_renders_from_prefetched_booking(self):
+        from booking.emails import build_booking_confirmation, confirmation_bookings
+        from booking.tickets import ensure_ticket_image
+
+        booking = confirmation_bookings().get(id=self.booking.id)
+        ensure_ticket_image(booking)
+        with self.assertNumQueries(0):
+            message = build_booking_confirmation(booking)
+            raw = message.message().as_bytes()
+
+        self.assertIn('SEATS: A1, A2', message.body)
+        html = message.alternatives[0][0]
+        self.assertIn(f'src="cid:ticket-{booking.ticket_reference}"', html)
+        self.assertIn(b'multipart/related', raw)
+        self.assertIn(f'<ticket-{booking.ticket_reference}>'.encode(), raw)
+
+    def test_failed_send_backs_off(self):
+        from unittest import mock
+        from booking.models import OutboundEmail
+        from booking.outbox import drain
+
+        self._webhook()
+        with mock.patch.dict('booking.outbox.BUILDERS', {'booking_confirmation': mock.Mock(side_effect=OSError("down"))}):
+            self.assertEqual(drain(), (0, 1))
+        entry = OutboundEmail.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('PENDING', 1, 'down'))
+        self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=40))
+
+    def test_unreachable_mail_server_backs_off_the_batch(self):
+        from unittest import mock
+        from booking.models import OutboundEmail
+        from booking.outbox import drain
+
+        self._webhook()
+        connection = mock.Mock(**{'open.side_effect': OSError("refused")})
+        with mock.patch('booking.outbox.get_connection', return_value=connection):
+            self.assertEqual(drain(), (0, 1))
+        entry = OutboundEmail.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('PENDING', 1, 'refused'))
+        self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=40))
+        connection.close.assert_not_called()
+
+    def test_webhook_rejects_bad_signature(self):
+        self.assertEqual(self._webhook(signature='forged').status_code, 400)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'PENDING')
+
+    def test_payment_failed_webhook_releases_seats(self):
+        self._webhook(event='payment.failed')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'FAILED')
+        self.assertFalse(ShowSeat.objects.filter(reserved_by__isnull=False).exists())
+
+    def test_capture_after_failure_reclaims_free_seats(self):
+        from booking.models import DailySales
+        from booking.rollups import rebuild_rollups, record_booking_created
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_booking_created(self.booking)
+        self._webhook(event='payment.failed', payment_id='pay_1')
+        self.assertEqual(self._webhook(payment_id='pay_2').json()['status'], 'ok')
+
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.razorpay_payment_id), ('CONFIRMED', 'pay_2'))
+        self.assertEqual(ShowSeat.objects.filter(is_booked=True).count(), 2)
+        self.show.refresh_from_db()
+        self.assertEqual((self.show.seats_available, self.show.seats_held, self.show.seats_booked), (0, 0, 2))
+        live = list(DailySales.objects.values_list('created', 'failed', 'bookings', 'tickets_sold'))
+        self.assertEqual(live, [(1, 0, 1, 2)])
+        rebuild_rollups()
+        self.assertEqual(list(DailySales.objects.values_list('created', 'failed', 'bookings', 'tickets_sold')), live)
+
+    def test_capture_after_failure_needs_refund_when_seats_are_gone(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        self._webhook(event='payment.failed', payment_id='pay_1')
+        taken = self.booking.seats.first()
+        ShowSeat.objects.claim(self.show, [taken.id], other)
+
+        with self.assertLogs('booking.views', 'ERROR'):
+            self._webhook(payment_id='pay_2')
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.status, self.booking.is_paid), ('REFUND', True))
+        self.assertEqual(self.booking.razorpay_payment_id, 'pay_2')
+        self.assertFalse(ShowSeat.objects.filter(reserved_by=self.user).exists())
+
+    def test_redirect_confirms_without_session(self):
+        from booking.gateway import get_gateway
+
+        self.client.force_login(self.user)
+        response = self.client.post('/booking/payment/success/', {
+            'razorpay_order_id': 'order_fake123',
+            'razorpay_payment_id': 'pay_1',
+            'razorpay_signature': get_gateway().sign('order_fake123', 'pay_1'),
+        })
+        self.assertRedirects(response, '/profile/')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'CONFIRMED')
+
+        status = self.client.get('/booking/payment/status/order_fake123/')
+        self.assertEqual(status.json(), {'status': 'paid', 'booking_id': self.booking.id})
+
+
+class BookingHistoryTestCase(ShowTestCase):
+    total_seats = 50
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.past = Show.objects.create(movie=self.movie, screen=self.screen, date=date.today() - timedelta(days=3), time=time(14, 0), price=200)
+        self.next = Show.objects.create(movie=self.movie, screen=self.screen, date=date.today() + timedelta(days=3), time=time(14, 0), price=200)
+        self.client.force_login(self.user)
+
+    def _book(self, show, count, status='CONFIRMED'):
+        bookings = []
+        for _ in range(count):
+            booking = Booking.objects.create(user=self.user, show=show, total_amount=400, status=status)
+            n = ShowSeat.objects.filter(show=show).count()
+            booking.seats.set([ShowSeat.objects.create(show=show, row="A", number=n + k, is_booked=True) for k in (1, 2)])
+            bookings.append(booking)
+        return bookings
+
+    def _profile_queries(self, **params):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/profile/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx)
+
+    def test_profile_queries_do_not_grow_with_bookings(self):
+        self._book(self.past, 1)
+        self._book(self.next, 1)
+        _, few = self._profile_queries()
+
+        self._book(self.past, 8)
+        self._book(self.next, 4)
+        response, many = self._profile_queries()
+        self.assertEqual(many, few)
+        self.assertEqual(len(response.context['upcoming_bookings']), 5)
+        self.assertEqual(len(response.context['bookings']), 9)
+        self.assertContains(response, "A1, A2")
+
+    def test_past_bookings_page_newest_first(self):
+        from booking.history import past_bookings, upcoming_bookings
+
+        older = self._book(self.past, 12)
+        failed = self._book(self.next, 1, status='FAILED')
+        self.assertEqual(upcoming_bookings(self.user), [])
+
+        first = past_bookings(self.user, per_page=10)
+        self.assertEqual(list(first), failed + older[::-1][:9])
+        second = past_bookings(self.user, first.next_cursor, per_page=10)
+        self.assertEqual(list(second), older[::-1][9:])
+        self.assertFalse(second.has_next)
+
+        response, _ = self._profile_queries(cursor=first.next_cursor)
+        self.assertEqual(list(response.context['bookings']), list(second))
+        self.assertEqual(self._profile_queries(cursor='garbage')[0].status_code, 200)
+
+    def test_mistyped_cursor_falls_back_to_the_first_page(self):
+        from bookmyseat.pagination import encode_cursor
+
+        older = self._book(self.past, 2)
+        for values in (['abc'], [None]):
+            response, _ = self._profile_queries(cursor=encode_cursor(values))
+            self.assertEqual(list(response.context['bookings']), older[::-1])
+
+    def test_upcoming_skips_abandoned_payments_and_is_capped(self):
+        from booking.history import upcoming_bookings
+
+        pending = self._book(self.next, 2, status='PENDING')
+        Booking.objects.filter(pk=pending[0].pk).update(
+            created_at=timezone.now() - timedelta(minutes=RESERVATION_TIMEOUT_MINUTES + 1)
+        )
+        confirmed = self._book(self.next, 3)
+        self.assertEqual(upcoming_bookings(self.user), pending[1:] + confirmed)
+        self.assertEqual(upcoming_bookings(self.user, limit=2), pending[1:] + confirmed[:1])
+
+
+class TicketImageTestCase(ShowTestCase):
+    total_seats = 1
+
+    def setUp(self):
+        import tempfile
+        self.root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(TICKET_IMAGE_ROOT=self.root))
+
+        self.user = User.objects.create_user(username='holder', password='testpass123')
+        self.booking = Booking.objects.create(user=self.user, show=self.show, total_amount=200, status='CONFIRMED')
+        self.booking.seats.add(ShowSeat.objects.create(show=self.show, row="A", number=1))
+
+    def test_image_is_content_addressed_and_reused(self):
+        import hashlib
+        import os
+        from booking.tickets import ensure_ticket_image
+
+        png = ensure_ticket_image(self.booking)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(self.booking.ticket_image, f"{hashlib.sha256(png).hexdigest()[:32]}.png")
+        self.assertEqual(os.listdir(self.root), [self.booking.ticket_image])
+
+        booking = Booking.objects.get(id=self.booking.id)
+        self.assertEqual(booking.ticket_image, self.booking.ticket_image)
+        with self.assertNumQueries(0):
+            self.assertEqual(ensure_ticket_image(booking), png)
+
+    def test_unwritable_image_root_falls_back_to_memory(self):
+        from unittest import mock
+        from booking.tickets import ensure_ticket_image
+
+        with mock.patch('booking.tickets.tempfile.mkstemp', side_effect=OSError(30, "Read-only file system")):
+            with self.assertLogs('booking.tickets', 'WARNING'):
+                png = ensure_ticket_image(self.booking)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(Booking.objects.get(id=self.booking.id).ticket_image, '')
+
+    def test_render_runs_inline_without_background_threads(self):
+        from unittest import mock
+        from booking.tickets import schedule_ticket_render
+
+        with override_settings(BACKGROUND_THREADS=False):
+            with mock.patch('booking.tickets._executor') as executor:
+                with self.captureOnCommitCallbacks(execute=True):
+                    schedule_ticket_render(self.booking)
+        executor.submit.assert_not_called()
+        self.assertTrue(Booking.objects.get(id=self.booking.id).ticket_image)
+
+    def test_image_is_served_immutable_to_its_owner_only(self):
+        from booking.tickets import ensure_ticket_image
+
+        ensure_ticket_image(self.booking)
+        url = f"/booking/tickets/{self.booking.ticket_image}"
+
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        self.client.force_login(User.objects.create_user(username='other', password='testpass123'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_scan_looks_up_reference(self):
+        self.client.force_login(User.objects.create_user(username='gate', password='testpass123', is_staff=True))
+        data = self.client.get(f"/booking/tickets/scan/{self.booking.ticket_reference.lower()}/").json()
+        self.assertEqual((data['valid'], data['seats']), (True, ['A1']))
+        self.assertEqual(self.client.get("/booking/tickets/scan/BMSNOPE/").status_code, 404)
+
+
+class GatewayResilienceTestCase(TestCase):
+    def test_retries_then_opens_circuit(self):
+        from booking.gateway import FakeGateway, PaymentGatewayError, CircuitOpen
+
+        gateway = FakeGateway(failure_rate=1.0, max_retries=2, backoff=0, failure_threshold=2)
+        for _ in range(2):
+            with self.assertRaises(PaymentGatewayError):
+                gateway.create_order(100, 'r')
+        with self.assertRaises(CircuitOpen):
+            gateway.create_order(100, 'r')
+
+        stats = gateway.stats.snapshot()
+        self.assertEqual((stats['calls'], stats['retries'], stats['rejected']), (6, 4, 1))
+        self.assertEqual(gateway.breaker.state, 'open')
+
+    def test_half_open_trial_closes_circuit(self):
+        from booking.gateway import FakeGateway
+
+        gateway = FakeGateway(max_retries=0, failure_threshold=1, reset_timeout=0)
+        gateway.breaker.record_failure()
+        self.assertEqual(gateway.breaker.state, 'open')
+        self.assertEqual(gateway.create_order(100, 'r')['amount'], 100)
+        self.assertEqual(gateway.breaker.state, 'closed')
+
+    def test_gateway_is_shared_per_process(self):
+        from booking.gateway import get_gateway
+
+        with override_settings(PAYMENT_GATEWAY='booking.gateway.RazorpayGateway'):
+            gateway = get_gateway()
+            self.assertIs(get_gateway(), gateway)
+            self.assertEqual(gateway.timeout, (3.05, 10.0))
+
+
+@override_settings(SEAT_EVENTS_ENABLED=True)
+class SeatEventsTestCase(ShowTestCase):
+    total_seats = 1
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='holder', password='testpass123')
+        self.seat = ShowSeat.objects.create(show=self.show, row="A", number=1)
+
+    def _reserve(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.seat.reserve(self.user)
+
+    async def test_transition_is_published_after_commit(self):
+        from asgiref.sync import sync_to_async
+        from booking.events import get_broker
+
+        subscription = get_broker().subscribe(self.show.id)
+        try:
+            await sync_to_async(self._reserve)()
+            event = await subscription.get(timeout=1)
+        finally:
+            subscription.close()
+
+        self.assertEqual(event['v'], 1)
+        seat_id, state, expires_at, holder_id = event['changes'][0]
+        self.assertEqual((seat_id, state, holder_id), (self.seat.id, 'held', self.user.id))
+
+    async def test_stream_sends_hello_then_seat_changes(self):
+        from booking.events import get_broker
+
+        response = await self.async_client.get(f'/booking/seat-events/{self.show.id}/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertIn(b'event: hello', await anext(stream))
+
+        get_broker().publish(self.show.id, {'v': 1, 'changes': [[self.seat.id, 'booked', None, None]]})
+        chunk = await anext(stream)
+        self.assertIn(b'event: seats', chunk)
+        self.assertIn(f'[[{self.seat.id}, "3", null]]'.encode(), chunk)
+        await stream.aclose()
+
+    def test_redis_listener_resubscribes_after_connection_error(self):
+        import asyncio
+        import json
+        from unittest import mock
+        from booking.events import LocalBroker, RedisBroker, Subscription
+
+        class Stop(Exception):
+            pass
+
+        message = {'channel': b'seats:7', 'data': json.dumps({'v': 2, 'changes': []})}
+        pubsub = mock.Mock()
+        pubsub.listen.side_effect = [ConnectionError("Connection reset by peer"), iter([message])]
+        # Built around a fake client, so the redis package is not needed.
+        broker = RedisBroker.__new__(RedisBroker)
+        LocalBroker.__init__(broker)
+        broker.channel_prefix = 'seats:'
+        broker._redis = mock.Mock(**{'pubsub.return_value': pubsub})
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        first = Subscription(broker, 7, asyncio.Queue(), loop)
+        broker._subscribers[7] = {first}
+        second = Subscription(broker, 7, asyncio.Queue(), loop)
+        sleeps = []
+
+        def sleep(delay):
+            sleeps.append(delay)
+            if len(sleeps) == 2:
+                raise Stop
+            # The ended client reconnects.
+            broker._subscribers[7] = {second}
+
+        with mock.patch('booking.events.time.sleep', side_effect=sleep), self.assertLogs('booking.events', 'ERROR'):
+            with self.assertRaises(Stop):
+                broker._listen()
+        loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(pubsub.psubscribe.call_count, 2)
+        self.assertEqual(sleeps, [1, 1])
+        self.assertIsNone(first.queue.get_nowait())
+        self.assertEqual([second.queue.get_nowait(), second.queue.get_nowait()], [{'v': 2, 'changes': []}, None])
+        self.assertEqual(broker._subscribers, {})
+
+    @override_settings(SEAT_EVENTS_ENABLED=False)
+    async def test_stream_disabled_by_default(self):
+        response = await self.async_client.get(f'/booking/seat-events/{self.show.id}/')
+        self.assertEqual(response.status_code, 404)
+
+
 class TrailerEmbedTestCase(TestCase):
     def test_youtube_watch_url(self):
         movie = Movie.objects.create(
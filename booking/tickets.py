@@ -0,0 +1,100 @@
+"""
+QR ticket images.
+
+Each confirmed booking gets a PNG QR code of its ``ticket_reference``,
+rendered once after the confirming transaction commits (on a worker
+thread, or inline when ``BACKGROUND_THREADS`` is off) and written under ``TICKET_IMAGE_ROOT``. Files are named by the
+hash of their bytes, so a stored image never changes and can be served
+with an immutable cache lifetime; the name is kept on
+``Booking.ticket_image``.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import qrcode
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Booking
+
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'TICKET_RENDER_WORKERS', 2), thread_name_prefix='ticket-render'
+)
+
+
+def ticket_image_root():
+    return getattr(settings, 'TICKET_IMAGE_ROOT', os.path.join(settings.MEDIA_ROOT, 'tickets'))
+
+
+def ticket_image_path(name):
+    return os.path.join(ticket_image_root(), name)
+
+
+def render_ticket_png(ticket_reference):
+    buffer = io.BytesIO()
+    qrcode.make(ticket_reference, box_size=6, border=2).save(buffer)
+    return buffer.getvalue()
+
+
+def store_ticket_png(png):
+    name = f"{hashlib.sha256(png).hexdigest()[:32]}.png"
+    path = ticket_image_path(name)
+    if not os.path.exists(path):
+        os.makedirs(ticket_image_root(), exist_ok=True)
+        # Write then rename, so readers never see a partial file.
+        fd, tmp = tempfile.mkstemp(dir=ticket_image_root(), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, path)
+    return name
+
+
+def ensure_ticket_image(booking):
+    """Return the booking's stored QR image bytes, rendering them if missing."""
+    if booking.ticket_image:
+        try:
+            with open(ticket_image_path(booking.ticket_image), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+    png = render_ticket_png(booking.ticket_reference)
+    try:
+        name = store_ticket_png(png)
+    except OSError as e:
+        # Read-only media (e.g. on Vercel): the bytes still serve the email.
+        logger.warning(f"Storing the ticket for booking {booking.pk} failed: {e}")
+        return png
+    booking.ticket_image = name
+    Booking.objects.filter(pk=booking.pk).update(ticket_image=name)
+    return png
+
+
+def schedule_ticket_render(booking):
+    booking_id = booking.pk
+    if getattr(settings, 'BACKGROUND_THREADS', True):
+        transaction.on_commit(lambda: _executor.submit(_render_in_background, booking_id))
+    else:
+        transaction.on_commit(lambda: _render_safely(booking_id))
+
+
+def _render_safely(booking_id):
+    try:
+        booking = Booking.objects.only('id', 'ticket_reference', 'ticket_image').get(pk=booking_id)
+        ensure_ticket_image(booking)
+    except Exception as e:
+        logger.error(f"Rendering the ticket for booking {booking_id} failed: {e}")
+
+
+def _render_in_background(booking_id):
+    try:
+        _render_safely(booking_id)
+    finally:
+        close_old_connections()
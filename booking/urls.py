@@ -5,8 +5,15 @@ app_name = 'booking'
 
 urlpatterns = [
     path('select-seats/<int:show_id>/', views.select_seats, name='select_seats'),
+    path('seat-map/<int:show_id>/', views.seat_map_data, name='seat_map_data'),
+    path('seat-events/<int:show_id>/', views.seat_events, name='seat_events'),
     path('payment/success/', views.payment_success, name='payment_success'),
     path('payment/failure/', views.payment_failure, name='payment_failure'),
+    path('payment/webhook/', views.payment_webhook, name='payment_webhook'),
+    path('payment/status/<str:order_id>/', views.payment_status, name='payment_status'),
+    path('tickets/<str:name>.png', views.ticket_image, name='ticket_image'),
+    path('tickets/scan/<str:reference>/', views.scan_ticket, name='scan_ticket'),
+    path('cron/send-queued-emails/', views.send_queued_emails, name='send_queued_emails'),
     path('test-email/', views.test_email, name='test_email'),
     path('run-migrations/', views.run_migrations, name='run_migrations'),
 ]
@@ -1,18 +1,27 @@
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
-from .models import Show, ShowSeat, Booking
-
-import razorpay
-import qrcode
-import io
-import base64
+from django.views.decorators.http import require_GET, require_POST
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, Http404, StreamingHttpResponse, FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from .models import Show, ShowSeat, Booking, PaymentEvent, SeatUnavailable
+from .seatmap import get_seat_map, STATE_CODES, AVAILABLE, BOOKED, RESERVED_OTHER, RESERVED_YOU
+from .events import get_broker
+from .gateway import get_gateway, PaymentGatewayError, SignatureMismatch
+from .outbox import drain, queue_booking_confirmation
+from .rollups import record_booking_confirmed, record_booking_created, record_booking_failed, record_booking_reclaimed
+from .tickets import schedule_ticket_render, ticket_image_path
+
+import asyncio
+import hmac
+import json
 import logging
 import subprocess
 import sys
@@ -31,6 +40,16 @@ def run_migrations(request):
     except Exception as e:
         return HttpResponse(f"Error: {str(e)}", status=500)
 
+@require_GET
+def send_queued_emails(request):
+    """Drain the email outbox; called on a schedule by Vercel cron with CRON_SECRET."""
+    secret = getattr(settings, 'CRON_SECRET', '')
+    expected = f"Bearer {secret}"
+    if not secret or not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+        return HttpResponse("Forbidden", status=403)
+    sent, failed = drain()
+    return JsonResponse({'sent': sent, 'failed': failed})
+
 def test_email(request):
     try:
         send_mail(
@@ -46,241 +65,229 @@ def test_email(request):
         return HttpResponse(f"Test email failed: {str(e)}", status=500)
 
 
-def get_razorpay_client():
-    return razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-
-
-def send_booking_confirmation(booking, request=None):
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    try:
-        try:
-            if not booking.ticket_reference:
-                booking.save()
-        except Exception as e:
-            logger.error(f"Error saving booking: {e}")
-            booking.ticket_reference = f"BMS{booking.id}"
-            booking.save()
-        
-        user_email = booking.user.email
-        if not user_email:
-            logger.error(f"User {booking.user.username} has no email address")
-            return False
-        
-        movie_name = booking.show.movie.name or "Movie"
-        theatre_name = booking.show.screen.theatre.name or "Theatre"
-        city = booking.show.screen.theatre.city or ""
-        show_date = booking.show.date.strftime('%d %B %Y')
-        show_time = booking.show.time.strftime('%I:%M %p')
-        
-        seats_list = list(booking.seats.all().order_by('row', 'number'))
-        seats_display = ", ".join([f"{s.row}{s.number}" for s in seats_list])
-        
-        subject = f'Booking Confirmed - {movie_name} | BookMySeat'
-        
-        text_content = f"""Dear {booking.user.username},
-
-Your booking is confirmed!
-
-BOOKING ID: {booking.ticket_reference}
-
-MOVIE: {movie_name}
-DATE: {show_date}
-TIME: {show_time}
-
-THEATRE: {theatre_name}
-SCREEN: {booking.show.screen.screen_number}
-
-SEATS: {seats_display}
-TOTAL: Rs. {booking.total_amount}
-
-Payment: Successful
-
-Important: Please arrive 15 minutes before the show and carry valid ID proof.
-
-Thank you for choosing BookMySeat!
-"""
-        
-        html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-</head>
-<body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f5f5f5;">
-    <div style="max-width: 600px; margin: 0 auto; background-color: #ffffff;">
-        <div style="background: linear-gradient(135deg, #eb3349 0%, #f45c43 100%); padding: 25px; text-align: center;">
-            <h1 style="color: #ffffff; margin: 0; font-size: 28px; font-weight: bold;">BOOK MY SEAT</h1>
-            <p style="color: #ffffff; margin: 5px 0 0 0; font-size: 14px;">Your Ticket Confirmation</p>
-        </div>
-        
-        <div style="padding: 25px;">
-            <div style="background-color: #d4edda; border-radius: 8px; padding: 20px; margin-bottom: 25px; border-left: 4px solid #28a745;">
-                <p style="margin: 0; color: #155724; font-weight: bold; font-size: 18px;">&#10003; Booking Confirmed</p>
-                <p style="margin: 5px 0 0 0; color: #155724; font-size: 14px;">Thank you for booking with us!</p>
-            </div>
-            
-            <div style="margin-bottom: 25px;">
-                <p style="margin: 0; color: #6c757d; font-size: 12px; text-transform: uppercase; letter-spacing: 1px;">Booking ID</p>
-                <p style="margin: 5px 0 0 0; color: #212529; font-size: 28px; font-weight: bold; font-family: monospace;">{booking.ticket_reference}</p>
-            </div>
-            
-            <div style="background-color: #f8f9fa; border-radius: 12px; padding: 20px; margin-bottom: 20px;">
-                <h3 style="margin: 0 0 15px 0; color: #212529; font-size: 16px; border-bottom: 2px solid #eb3349; padding-bottom: 10px;">Movie</h3>
-                <p style="margin: 0; color: #212529; font-size: 20px; font-weight: bold;">{movie_name}</p>
-                <p style="margin: 8px 0 0 0; color: #6c757d; font-size: 14px;">&#128197; {show_date} &nbsp;|&nbsp; &#9200; {show_time}</p>
-            </div>
-            
-            <div style="background-color: #f8f9fa; border-radius: 12px; padding: 20px; margin-bottom: 20px;">
-                <h3 style="margin: 0 0 15px 0; color: #212529; font-size: 16px; border-bottom: 2px solid #eb3349; padding-bottom: 10px;">Theatre</h3>
-                <p style="margin: 0; color: #212529; font-size: 18px; font-weight: bold;">{theatre_name}</p>
-                <p style="margin: 5px 0 0 0; color: #6c757d; font-size: 14px;">&#127916; Screen {booking.show.screen.screen_number}</p>
-                {f'<p style="margin: 5px 0 0 0; color: #6c757d; font-size: 14px;">&#128205; {city}</p>' if city else ''}
-            </div>
-            
-            <div style="background-color: #f8f9fa; border-radius: 12px; padding: 20px; margin-bottom: 20px;">
-                <h3 style="margin: 0 0 15px 0; color: #212529; font-size: 16px; border-bottom: 2px solid #eb3349; padding-bottom: 10px;">Seats</h3>
-                <p style="margin: 0; color: #212529; font-size: 24px; font-weight: bold; letter-spacing: 2px;">{seats_display}</p>
-                <p style="margin: 8px 0 0 0; color: #6c757d; font-size: 14px;">Total: {len(seats_list)} seat(s)</p>
-            </div>
-            
-            <div style="background-color: #f8f9fa; border-radius: 12px; padding: 20px; margin-bottom: 20px;">
-                <h3 style="margin: 0 0 15px 0; color: #212529; font-size: 16px; border-bottom: 2px solid #eb3349; padding-bottom: 10px;">Payment</h3>
-                <p style="margin: 0; color: #212529; font-size: 28px; font-weight: bold;">&#8377; {booking.total_amount}</p>
-                <p style="margin: 8px 0 0 0; color: #28a745; font-size: 14px; font-weight: bold;">&#10003; Payment Successful</p>
-            </div>
-            
-            <div style="background-color: #fff3cd; border-radius: 8px; padding: 15px; border-left: 4px solid #ffc107;">
-                <p style="margin: 0; color: #856404; font-size: 14px;"><strong>&#9888; Important:</strong></p>
-                <ul style="margin: 10px 0 0 0; padding-left: 20px; color: #856404; font-size: 13px;">
-                    <li style="margin-bottom: 5px;">Please arrive at least 15 minutes before the show</li>
-                    <li style="margin-bottom: 5px;">Carry a valid ID proof along with this ticket</li>
-                    <li style="margin-bottom: 0;">This ticket is non-transferable</li>
-                </ul>
-            </div>
-        </div>
-        
-        <div style="background-color: #212529; padding: 25px; text-align: center;">
-            <p style="color: #ffffff; margin: 0; font-size: 18px; font-weight: bold;">BOOK MY SEAT</p>
-            <p style="color: #adb5bd; margin: 8px 0 0 0; font-size: 12px;">Thank you for choosing BookMySeat!</p>
-            <p style="color: #adb5bd; margin: 5px 0 0 0; font-size: 12px;">Happy Watching &#127909;</p>
-        </div>
-    </div>
-</body>
-</html>
-"""
-        
-        from django.core.mail import EmailMultiAlternatives
-        msg = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            [user_email]
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=False)
-        logger.info(f"Email sent successfully to {user_email} for booking {booking.ticket_reference}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Email sending failed: {str(e)}")
-        print(f"Email error: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-
-
 @login_required
 def select_seats(request, show_id):
     from django.utils import timezone
-    from datetime import timedelta
     from booking.models import RESERVATION_TIMEOUT_MINUTES
-    
+
     show = get_object_or_404(Show, id=show_id)
-    
-    all_seats = ShowSeat.objects.filter(show=show).order_by('row', 'number')
-    
-    current_time = timezone.now()
-    for seat in all_seats:
-        if seat.reserved_by and not seat.is_booked:
-            expiry_time = seat.reserved_at + timedelta(minutes=RESERVATION_TIMEOUT_MINUTES)
-            if current_time > expiry_time:
-                seat.release()
-    
-    show_seats = ShowSeat.objects.filter(show=show).order_by('row', 'number')
 
     if request.method == 'POST':
-        selected_ids = request.POST.getlist('seats')
+        selected_ids = [seat_id for seat_id in request.POST.getlist('seats') if seat_id.isdigit()]
 
         if not selected_ids:
                 messages.error(request, "Please select at least one seat.")
-                return redirect('select_seats', show_id=show.id)
+                return redirect('booking:select_seats', show_id=show.id)
 
-        with transaction.atomic():
-            seats = ShowSeat.objects.select_for_update().filter(
-                id__in=selected_ids,
-                show=show
-            )
-            
-            for seat in seats:
-                if seat.is_booked:
-                    messages.error(request, f"Seat {seat.row}{seat.number} is already booked.")
-                    return redirect(request.path)
-                
-                if seat.is_reserved and seat.reserved_by != request.user:
-                    messages.error(request, f"Seat {seat.row}{seat.number} is reserved by another user. Please select different seats.")
-                    return redirect(request.path)
-
-            if seats.count() != len(selected_ids):
-                messages.error(request, "Some seats are no longer available.")
-                return redirect('select_seats', show_id=show.id)
+        if show.is_houseful:
+            messages.error(request, "Sorry, this show is sold out.")
+            return redirect('movies:movie_detail', movie_id=show.movie_id)
 
-            total_amount = seats.count() * show.price
+        # Phase one: commit the hold and the PENDING booking, so the seat
+        # rows are not locked while we wait on the payment gateway.
+        try:
+            with transaction.atomic():
+                seat_ids = ShowSeat.objects.claim(show, map(int, selected_ids), request.user)
+
+                booking = Booking.objects.create(
+                    user=request.user,
+                    show=show,
+                    total_amount=len(seat_ids) * show.price,
+                    status='PENDING',
+                    is_paid=False
+                )
+
+                booking.seats.set(seat_ids)
+                record_booking_created(booking)
+
+        except SeatUnavailable as e:
+            taken = ", ".join(str(seat) for seat in e.seats)
+            if taken:
+                messages.error(request, f"Seat(s) {taken} are no longer available. Please select different seats.")
+            else:
+                messages.error(request, "Some seats are no longer available.")
+            return redirect('booking:select_seats', show_id=show.id)
 
-            booking = Booking.objects.create(
-                user=request.user,
-                show=show,
-                total_amount=total_amount,
-                status='PENDING',
-                is_paid=False
+        # Phase two: create the gateway order, giving the seats back if it fails.
+        try:
+            razorpay_order = get_gateway().create_order(
+                int(booking.total_amount * 100), receipt=f'booking_{booking.id}'
             )
+        except PaymentGatewayError as e:
+            logger.error(f"Order creation failed for booking {booking.id}: {e}")
+            fail_booking(booking)
+            messages.error(request, "We couldn't start the payment. Please try again.")
+            return redirect('booking:select_seats', show_id=show.id)
 
-            booking.seats.set(seats)
-            
-            for seat in seats:
-                seat.reserve(request.user)
-
-            request.session['booking_id'] = booking.id
-            request.session['booking_created_at'] = timezone.now().isoformat()
+        booking.razorpay_order_id = razorpay_order['id']
+        booking.save(update_fields=['razorpay_order_id'])
 
-            amount_in_paise = int(total_amount * 100)
+        request.session['booking_id'] = booking.id
+        request.session['booking_created_at'] = timezone.now().isoformat()
 
-            razorpay_client = get_razorpay_client()
-            razorpay_order = razorpay_client.order.create({
-                'amount': amount_in_paise,
-                'currency': 'INR',
-                'receipt': f'booking_{booking.id}',
-                'payment_capture': 1
-            })
+        return render(request, 'booking/payment.html', {
+            'booking': booking,
+            'razorpay_order': razorpay_order,
+            'razorpay_key': settings.RAZORPAY_KEY_ID
+        })
 
-            booking.razorpay_order_id = razorpay_order.get('id')
-            booking.save()
-
-            return render(request, 'booking/payment.html', {
-                'booking': booking,
-                'razorpay_order': razorpay_order,
-                'razorpay_key': settings.RAZORPAY_KEY_ID
-            })
+    seat_map = get_seat_map(show)
 
     return render(request, 'booking/select_seats.html', {
         'show': show,
-        'show_seats': show_seats,
+        'seat_rows': seat_map.rows(request.user.id),
+        'seat_version': seat_map.version,
+        'seat_events_enabled': getattr(settings, 'SEAT_EVENTS_ENABLED', False),
         'reservation_timeout': RESERVATION_TIMEOUT_MINUTES
     })
 
 
+@require_GET
+def seat_map_data(request, show_id):
+    show = get_object_or_404(Show.objects.only('id', 'seat_version'), id=show_id)
+    user_id = request.user.id
+
+    # The encoding marks the caller's own holds, so the tag is per user, and
+    # holds lapse without a version bump, so it also changes when one does.
+    seat_map = get_seat_map(show)
+    etag = quote_etag(f"{show.id}.{show.seat_version}.{seat_map.next_expiry()}.{user_id or 0}")
+    response = get_conditional_response(request, etag=etag)
+
+    if response is None:
+        since = request.GET.get('since', '')
+        if since.isdigit() and int(since) <= seat_map.version:
+            response = JsonResponse(seat_map.encode_delta(int(since), user_id))
+        else:
+            response = JsonResponse(seat_map.encode(user_id))
+
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def _seat_event(event, user_id):
+    changes = []
+    for seat_id, state, expires_at, holder_id in event['changes']:
+        if state == 'booked':
+            code = STATE_CODES[BOOKED]
+        elif state == 'held':
+            code = STATE_CODES[RESERVED_YOU if user_id and holder_id == user_id else RESERVED_OTHER]
+        else:
+            code = STATE_CODES[AVAILABLE]
+        changes.append([seat_id, code, expires_at])
+    return f"id: {event['v']}\nevent: seats\ndata: {json.dumps({'v': event['v'], 'changes': changes})}\n\n"
+
+
+async def _seat_event_stream(subscription, version, user_id):
+    heartbeat = getattr(settings, 'SEAT_EVENTS_HEARTBEAT_SECONDS', 15)
+    try:
+        yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'v': version})}\n\n"
+        while True:
+            try:
+                event = await subscription.get(timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                # The broker lost its feed; the client reconnects and resyncs.
+                return
+            yield _seat_event(event, user_id)
+    finally:
+        subscription.close()
+
+
+async def seat_events(request, show_id):
+    if not getattr(settings, 'SEAT_EVENTS_ENABLED', False):
+        raise Http404("Seat events are not enabled")
+    # Subscribe before reading the version so no change can fall in between.
+    subscription = get_broker().subscribe(show_id)
+    try:
+        show = await Show.objects.only('id', 'seat_version').aget(id=show_id)
+    except Show.DoesNotExist:
+        subscription.close()
+        raise Http404("Show not found")
+
+    user = await request.auser()
+    response = StreamingHttpResponse(
+        _seat_event_stream(subscription, show.seat_version, user.id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _reclaim_failed_booking(booking, paid):
+    # A capture can still arrive after the booking failed, e.g. a retried
+    # payment after payment.failed. Take the seats back if nobody else has
+    # them; otherwise the customer is owed a refund.
+    if not Booking.objects.filter(pk=booking.pk, status='FAILED').update(status='CONFIRMED', **paid):
+        return False
+    seat_ids = list(booking.seats.values_list('id', flat=True))
+    try:
+        ShowSeat.objects.claim(booking.show, seat_ids, booking.user)
+    except SeatUnavailable as e:
+        Booking.objects.filter(pk=booking.pk).update(status='REFUND')
+        logger.error(
+            f"Booking {booking.id} was paid ({paid['razorpay_payment_id']}) after it failed, "
+            f"but seats {e} are taken; it needs a refund"
+        )
+        return False
+    record_booking_reclaimed(booking)
+    return True
+
+
+def confirm_booking(booking, payment_id, signature=None):
+    # Safe to call from both the browser redirect and the webhook: only the
+    # first caller moves the booking out of PENDING, the rest are no-ops.
+    paid = {'is_paid': True, 'razorpay_payment_id': payment_id, 'razorpay_signature': signature}
+    with transaction.atomic():
+        confirmed = Booking.objects.filter(pk=booking.pk, status='PENDING').update(status='CONFIRMED', **paid)
+        if not confirmed and not _reclaim_failed_booking(booking, paid):
+            return False
+
+        tickets = booking.seats.count()
+        with transaction.atomic():
+            booked = booking.confirm_seats()
+            if booked != tickets:
+                transaction.set_rollback(True)
+
+        if booked != tickets:
+            # Some holds lapsed and were taken before the payment landed.
+            # Selling part of what was paid for is not ours to decide, so
+            # nothing is booked and the payment is flagged for a refund.
+            booking.release_seats()
+            Booking.objects.filter(pk=booking.pk).update(status='REFUND')
+            record_booking_failed(booking)
+            logger.error(
+                f"Booking {booking.id} was paid ({payment_id}) but only {booked} of its "
+                f"{tickets} seats were still held; it needs a refund"
+            )
+            return False
+
+        record_booking_confirmed(booking, tickets)
+
+        schedule_ticket_render(booking)
+        queue_booking_confirmation(booking)
+
+    return True
+
+
+def fail_booking(booking):
+    with transaction.atomic():
+        failed = Booking.objects.filter(pk=booking.pk, status='PENDING').update(status='FAILED')
+        if failed:
+            booking.release_seats()
+            record_booking_failed(booking)
+    return bool(failed)
+
+
+def _clear_booking_session(request):
+    request.session.pop('booking_id', None)
+    request.session.pop('booking_created_at', None)
+
+
 @csrf_exempt
 def payment_success(request):
     if request.method == 'POST':
@@ -289,51 +296,27 @@ def payment_success(request):
             order_id = request.POST.get('razorpay_order_id')
             signature = request.POST.get('razorpay_signature')
 
-            booking_id = request.session.get('booking_id')
-            if not booking_id:
+            booking = Booking.objects.filter(razorpay_order_id=order_id, user_id=request.user.id).first()
+            if not booking:
                 messages.error(request, "Invalid booking session.")
                 return redirect('movies:movie_list')
 
-            booking = Booking.objects.get(id=booking_id, user=request.user)
-
-            params_dict = {
-                'razorpay_payment_id': payment_id,
-                'razorpay_order_id': order_id,
-                'razorpay_signature': signature
-            }
-
             try:
-                razorpay_client = get_razorpay_client()
-                razorpay_client.utility.verify_payment_signature(params_dict)
-                booking.is_paid = True
-                booking.status = 'CONFIRMED'
-                booking.razorpay_payment_id = payment_id
-                booking.razorpay_signature = signature
-                booking.save()
-
-                for seat in booking.seats.all():
-                    seat.is_booked = True
-                    seat.reserved_by = None
-                    seat.reserved_at = None
-                    seat.save()
-
-                email_result = send_booking_confirmation(booking)
-                
-                logger.info(f"Booking {booking.id} - Email function called, result: {email_result}")
-
-                if 'booking_id' in request.session:
-                    del request.session['booking_id']
-                if 'booking_created_at' in request.session:
-                    del request.session['booking_created_at']
-
-                messages.success(request, "Payment successful! Your booking is confirmed. Check your email for details.")
-                return redirect('profile')
-
+                get_gateway().verify_payment_signature(order_id, payment_id, signature)
             except Exception as e:
-                booking.status = 'FAILED'
-                booking.save()
+                fail_booking(booking)
                 messages.error(request, f"Payment verification failed: {str(e)}")
-                return redirect('select_seats', show_id=booking.show.id)
+                return redirect('booking:select_seats', show_id=booking.show_id)
+
+            confirm_booking(booking, payment_id, signature)
+            _clear_booking_session(request)
+
+            if Booking.objects.filter(pk=booking.pk, status='REFUND').exists():
+                messages.error(request, "Your seats were released before the payment went through. Your payment will be refunded.")
+                return redirect('booking:select_seats', show_id=booking.show_id)
+
+            messages.success(request, "Payment successful! Your booking is confirmed. Check your email for details.")
+            return redirect('profile')
 
         except Exception as e:
             messages.error(request, f"Error processing payment: {str(e)}")
@@ -345,53 +328,121 @@ def payment_success(request):
 @csrf_exempt
 def payment_failure(request):
     if request.method == 'POST':
-        booking_id = request.session.get('booking_id')
-        if booking_id:
-            try:
-                booking = Booking.objects.get(id=booking_id, user=request.user)
-                booking.status = 'FAILED'
-                booking.save()
-                
-                for seat in booking.seats.all():
-                    seat.release()
-                
-                if 'booking_id' in request.session:
-                    del request.session['booking_id']
-                if 'booking_created_at' in request.session:
-                    del request.session['booking_created_at']
-            except Booking.DoesNotExist:
-                pass
+        order_id = request.POST.get('razorpay_order_id')
+        if order_id:
+            booking = Booking.objects.filter(razorpay_order_id=order_id, user_id=request.user.id).first()
+        else:
+            booking = Booking.objects.filter(id=request.session.get('booking_id'), user_id=request.user.id).first()
+        if booking:
+            fail_booking(booking)
+            _clear_booking_session(request)
 
     messages.error(request, "Payment failed. Please try again.")
     return redirect('movies:movie_list')
 
 
+@login_required
+@require_GET
+def ticket_image(request, name):
+    filters = {'ticket_image': f"{name}.png", 'status': 'CONFIRMED'}
+    if not request.user.is_staff:
+        filters['user'] = request.user
+    booking = get_object_or_404(Booking.objects.only('id', 'ticket_image'), **filters)
+
+    try:
+        response = FileResponse(open(ticket_image_path(booking.ticket_image), 'rb'), content_type='image/png')
+    except FileNotFoundError:
+        raise Http404("Ticket image not found")
+    # The name is the hash of the bytes, so the file never changes.
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+@staff_member_required
+@require_GET
+def scan_ticket(request, reference):
+    booking = (
+        Booking.objects.select_related('show__movie', 'show__screen__theatre')
+        .prefetch_related('seats')
+        .filter(ticket_reference=reference.strip().upper())
+        .first()
+    )
+    if not booking:
+        return JsonResponse({'valid': False, 'message': 'Unknown ticket'}, status=404)
+
+    show = booking.show
+    return JsonResponse({
+        'valid': booking.status == 'CONFIRMED',
+        'status': booking.status,
+        'reference': booking.ticket_reference,
+        'movie': show.movie.name,
+        'theatre': show.screen.theatre.name,
+        'screen': show.screen.screen_number,
+        'date': show.date.isoformat(),
+        'time': show.time.strftime('%H:%M'),
+        'seats': sorted(f"{seat.row}{seat.number}" for seat in booking.seats.all()),
+    })
+
+
+WEBHOOK_CONFIRM_EVENTS = ('payment.captured', 'order.paid')
+WEBHOOK_FAIL_EVENTS = ('payment.failed',)
+
+
 @csrf_exempt
-def check_payment_status(request):
-    if request.method == 'POST':
-        import json
+@require_POST
+def payment_webhook(request):
+    signature = request.headers.get('X-Razorpay-Signature', '')
+    try:
+        get_gateway().verify_webhook_signature(request.body, signature)
+    except SignatureMismatch:
+        return HttpResponseBadRequest("Invalid signature")
+
+    try:
+        data = json.loads(request.body)
+        event = data['event']
+        payment = data['payload']['payment']['entity']
+        payment_id = payment['id']
+        order_id = payment['order_id']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("Malformed payload")
+
+    if event not in WEBHOOK_CONFIRM_EVENTS + WEBHOOK_FAIL_EVENTS:
+        return JsonResponse({'status': 'ignored'})
+
+    booking = Booking.objects.filter(razorpay_order_id=order_id).first()
+    if not booking:
+        logger.warning(f"Webhook {event} for unknown order {order_id}")
+        return JsonResponse({'status': 'ignored'})
+
+    # Recording the payment id makes replays (and the second of
+    # payment.captured/order.paid) no-ops. It commits together with the
+    # booking change, so an event that fails half way is retried in full.
+    with transaction.atomic():
         try:
-            data = json.loads(request.body)
-            order_id = data.get('order_id')
-            
-            if not order_id:
-                return JsonResponse({'status': 'error', 'message': 'No order ID provided'})
-            
-            booking = Booking.objects.filter(razorpay_order_id=order_id).first()
-            
-            if not booking:
-                return JsonResponse({'status': 'error', 'message': 'Booking not found'})
-            
-            if booking.is_paid:
-                return JsonResponse({
-                    'status': 'paid',
-                    'payment_id': booking.razorpay_payment_id,
-                    'booking_id': booking.id
-                })
-            else:
-                return JsonResponse({'status': 'pending'})
-                
-        except Exception as e:
-            return JsonResponse({'status': 'error', 'message': str(e)})
-    
-    return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+            with transaction.atomic():
+                PaymentEvent.objects.create(payment_id=payment_id, order_id=order_id, event=event)
+        except IntegrityError:
+            return JsonResponse({'status': 'duplicate'})
+
+        if event in WEBHOOK_CONFIRM_EVENTS:
+            confirm_booking(booking, payment_id)
+        else:
+            fail_booking(booking)
+    return JsonResponse({'status': 'ok'})
+
+
+@require_GET
+def payment_status(request, order_id):
+    # Answers straight away; the payment page polls. Waiting here would
+    # tie up a WSGI worker per open checkout.
+    if not request.user.is_authenticated:
+        return JsonResponse({'status': 'error', 'message': 'Login required'}, status=401)
+
+    booking = Booking.objects.filter(razorpay_order_id=order_id, user=request.user).values('id', 'status').first()
+    if not booking:
+        return JsonResponse({'status': 'error', 'message': 'Booking not found'}, status=404)
+
+    status = {'CONFIRMED': 'paid', 'FAILED': 'failed', 'REFUND': 'failed'}.get(booking['status'], 'pending')
+    response = JsonResponse({'status': status, 'booking_id': booking['id']})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
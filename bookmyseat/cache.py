@@ -0,0 +1,157 @@
+"""
+Catalogue cache with namespaced, versioned keys.
+
+Cached values belong to one or more namespaces (``movies``,
+``showtimes``). Each namespace has a version counter in the cache, and
+every entry records the versions it was built from. Changing a model
+bumps the namespaces that depend on it (see ``invalidate_on_change``);
+no keys are deleted, so entries simply become stale.
+
+A stale or expired entry is still served while one caller, holding a
+short lock, rebuilds it. A burst of invalidations therefore costs one
+rebuild per key rather than one per request. On a cold miss there is
+nothing to serve, so other callers wait briefly for the lock holder's
+value before building one themselves. Entries are dropped for
+good once they are ``CATALOGUE_CACHE_STALE_SECONDS`` past their timeout.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+
+KEY_PREFIX = 'catalogue'
+LOCK_TIMEOUT = 30
+# How long a cold miss waits for another caller's build, and how often it looks.
+COLD_WAIT_SECONDS = 2
+COLD_WAIT_STEP = 0.05
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOGUE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(namespace):
+    return f"{KEY_PREFIX}:{namespace}:version"
+
+
+def _entry_key(namespaces, key):
+    return f"{KEY_PREFIX}:{'+'.join(namespaces)}:{key}"
+
+
+def _versions(cache, namespaces, extra_keys=()):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys + list(extra_keys))
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            # Start from the clock, so a counter that was evicted never
+            # comes back at a number some old entry was built against.
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        versions.append(version)
+    return tuple(versions), found
+
+
+def bump(*namespaces):
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.set(_version_key(namespace), time.time_ns(), None)
+
+
+def cached(namespaces, key, builder, timeout=None):
+    """
+    Return ``builder()``'s value from the cache, rebuilding it when stale.
+
+    A builder may return ``None`` to have nothing cached.
+    """
+    cache = get_cache()
+    timeout = timeout or getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+    entry_key = _entry_key(namespaces, key)
+    versions, found = _versions(cache, namespaces, [entry_key])
+    entry = found.get(entry_key)
+
+    if entry is not None:
+        entry_versions, fresh_until, value = entry
+        if entry_versions == versions and time.time() < fresh_until:
+            return value
+
+    lock_key = f"{entry_key}:lock"
+    if not cache.add(lock_key, True, LOCK_TIMEOUT):
+        # Someone else is already rebuilding it.
+        if entry is not None:
+            return value
+        deadline = time.monotonic() + COLD_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(COLD_WAIT_STEP)
+            found = cache.get_many([entry_key, lock_key])
+            if entry_key in found:
+                return found[entry_key][2]
+            if lock_key not in found:
+                break
+        # Nothing cached (or not yet): build for this caller only.
+        return builder()
+
+    try:
+        value = builder()
+        if value is not None:
+            stale_for = getattr(settings, 'CATALOGUE_CACHE_STALE_SECONDS', 600)
+            cache.set(entry_key, (versions, time.time() + timeout, value), timeout + stale_for)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def invalidate_on_change(model, *namespaces):
+    def invalidate(sender, **kwargs):
+        bump(*namespaces)
+
+    dispatch_uid = f"{KEY_PREFIX}:{model._meta.label}:{'+'.join(namespaces)}"
+    post_save.connect(invalidate, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(invalidate, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+
+def cache_anonymous_page(*namespaces, timeout=None):
+    """
+    Cache a GET view's whole response for anonymous visitors.
+
+    Signed-in users, pending flash messages and non-200 responses always
+    go through the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            user = getattr(request, 'user', None)
+            if (request.method != 'GET' or user is None or user.is_authenticated
+                    or len(messages.get_messages(request))):
+                return view(request, *args, **kwargs)
+
+            uncacheable = []
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or response.cookies:
+                    uncacheable.append(response)
+                    return None
+                return response.content, response['Content-Type']
+
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            page = cached(namespaces, f"page:{view.__name__}:{path}", render, timeout)
+            if uncacheable:
+                return uncacheable[0]
+
+            response = HttpResponse(page[0], content_type=page[1])
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET``, each page is fetched with a ``WHERE`` on the
+ordering columns of the last row seen, so deep pages cost the same as
+the first one and rows inserted meanwhile don't shift pages. The
+ordering must end in a unique column (normally ``id``) for cursors to be
+unambiguous, and the ordering columns must not be null. Cursors are
+opaque URL-safe strings.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.object_list = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def encode_cursor(values, backwards=False):
+    payload = json.dumps({'k': values, 'b': int(backwards)}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return list(payload['k']), bool(payload['b'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _parse_ordering(ordering):
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def _after(fields, values):
+    # (a, b, c) > (x, y, z), spelled out per column so mixed directions work.
+    condition = Q()
+    for i, (field, descending) in enumerate(fields):
+        step = Q(**{f"{field}__{'lt' if descending else 'gt'}": values[i]})
+        for (prior, _), value in zip(fields[:i], values):
+            step &= Q(**{prior: value})
+        condition |= step
+    return condition
+
+
+def _key(item, fields):
+    return [getattr(item, field) for field, _ in fields]
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=20):
+    """
+    Return the page of ``queryset`` after (or before) ``cursor``.
+
+    An invalid cursor, including a well-formed one holding values of the
+    wrong type for its columns, raises ``InvalidCursor``; views usually
+    fall back to the first page.
+    """
+    fields = _parse_ordering(ordering)
+    backwards = False
+    if cursor:
+        values, backwards = decode_cursor(cursor)
+        if len(values) != len(fields):
+            raise InvalidCursor(cursor)
+        if backwards:
+            fields_after = [(field, not descending) for field, descending in fields]
+        else:
+            fields_after = fields
+        try:
+            queryset = queryset.filter(_after(fields_after, values))
+        except (ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+    if backwards:
+        queryset = queryset.order_by(*[field if descending else f"-{field}" for field, descending in fields])
+    else:
+        queryset = queryset.order_by(*ordering)
+
+    try:
+        items = list(queryset[:per_page + 1])
+    except (ValueError, TypeError, ValidationError) as e:
+        if not cursor:
+            raise
+        raise InvalidCursor(cursor) from e
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if backwards:
+        items.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(_key(items[-1], fields)) if items and has_next else None,
+        previous_cursor=encode_cursor(_key(items[0], fields), backwards=True) if items and has_previous else None,
+    )
+
+
+def cursor_url(request, cursor):
+    """The current URL with its ``cursor`` parameter replaced."""
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f"?{params.urlencode()}"
+
+
+def page_links(request, page):
+    return {
+        'previous_page_url': cursor_url(request, page.previous_cursor) if page.has_previous else None,
+        'next_page_url': cursor_url(request, page.next_cursor) if page.has_next else None,
+    }
@@ -54,9 +54,25 @@ EMAIL_USE_TLS=os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER=os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD=os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL=os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@bookmyshow.com')
+# Work left for after the response (sending queued emails, rendering
+# tickets, refreshing the dashboard) runs on background threads. Serverless
+# hosts such as Vercel freeze the process once the response is sent, so
+# there it runs inline instead; this is off by default when VERCEL is set.
+BACKGROUND_THREADS = os.environ.get('BACKGROUND_THREADS', 'False' if os.environ.get('VERCEL') else 'True') == 'True'
+# Queued emails are sent by `manage.py send_queued_emails`, or by the cron
+# endpoint /booking/cron/send-queued-emails/ (see vercel.json), which needs
+# CRON_SECRET set and is refused without it. When eager, the outbox is also
+# drained as soon as a booking commits, so retries are all the schedule
+# has to catch up on.
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+EMAIL_OUTBOX_EAGER=os.environ.get('EMAIL_OUTBOX_EAGER', 'True') == 'True'
+EMAIL_OUTBOX_MAX_ATTEMPTS=int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# QR ticket images are always kept on local disk, whatever the media storage.
+TICKET_IMAGE_ROOT = os.environ.get('TICKET_IMAGE_ROOT', os.path.join(MEDIA_ROOT, 'tickets'))
+TICKET_RENDER_WORKERS = int(os.environ.get('TICKET_RENDER_WORKERS', '2'))
 
 if os.environ.get('CLOUDINARY_URL'):
     DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
@@ -129,5 +145,65 @@ STORAGES = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Local memory by default; point CACHE_REDIS_URL at Redis to share the
+# cache (and catalogue invalidations) between workers.
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+            'KEY_PREFIX': 'bookmyseat',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bookmyseat',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Catalogue pages are fresh for CATALOGUE_CACHE_TIMEOUT seconds and may be
+# served stale for CATALOGUE_CACHE_STALE_SECONDS more while one request
+# rebuilds them.
+CATALOGUE_CACHE_TIMEOUT = int(os.environ.get('CATALOGUE_CACHE_TIMEOUT', '300'))
+CATALOGUE_CACHE_STALE_SECONDS = int(os.environ.get('CATALOGUE_CACHE_STALE_SECONDS', '600'))
+# Showtimes carry live seat counts, so they are kept much more briefly.
+SHOWTIMES_CACHE_TIMEOUT = int(os.environ.get('SHOWTIMES_CACHE_TIMEOUT', '30'))
+
+SEAT_MAP_CACHE_SIZE = int(os.environ.get('SEAT_MAP_CACHE_SIZE', '256'))
+
+# Seat availability streams need the ASGI application (bookmyseat.asgi);
+# under WSGI each stream would pin a worker, so seat pages poll instead
+# unless SEAT_EVENTS_ENABLED is set. Use booking.events.RedisBroker with
+# SEAT_EVENTS_REDIS_URL when running more than one worker process.
+SEAT_EVENTS_ENABLED = os.environ.get('SEAT_EVENTS_ENABLED', 'False') == 'True'
+SEAT_EVENTS_BROKER = os.environ.get('SEAT_EVENTS_BROKER', 'booking.events.LocalBroker')
+SEAT_EVENTS_REDIS_URL = os.environ.get('SEAT_EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+SEAT_EVENTS_HEARTBEAT_SECONDS = int(os.environ.get('SEAT_EVENTS_HEARTBEAT_SECONDS', '15'))
+
+# Release lapsed seat holds from a background thread (booking.expiry). Each
+# worker runs one, and only the one holding a lease in the default cache
+# acts; that needs a cache shared by all workers (CACHE_REDIS_URL), since
+# with the local-memory default every worker leads (check booking.W001).
+# Alternatively run `manage.py run_hold_expiry` as its own process.
+HOLD_EXPIRY_SCHEDULER = os.environ.get('HOLD_EXPIRY_SCHEDULER', 'False') == 'True'
+HOLD_EXPIRY_TICK_SECONDS = float(os.environ.get('HOLD_EXPIRY_TICK_SECONDS', '1'))
+HOLD_EXPIRY_SYNC_SECONDS = float(os.environ.get('HOLD_EXPIRY_SYNC_SECONDS', '5'))
+
+# The staff dashboard is served from a snapshot rebuilt in the background
+# this often (users.dashboard), or by the first request after that when
+# there is no background thread.
+DASHBOARD_REFRESH_SECONDS = int(os.environ.get('DASHBOARD_REFRESH_SECONDS', '60'))
+DASHBOARD_BACKGROUND_REFRESH = os.environ.get('DASHBOARD_BACKGROUND_REFRESH', 'True') == 'True'
+
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_SHzQaP22YUeqFR')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'ED49KFFvM451xRVckpzC83IN')
+RAZORPAY_WEBHOOK_SECRET = os.environ.get('RAZORPAY_WEBHOOK_SECRET', '')
+
+# booking.gateway.FakeGateway answers locally for offline and load testing.
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'booking.gateway.RazorpayGateway')
+# e.g. connect_timeout, read_timeout, pool_size, max_retries, backoff,
+# failure_threshold, reset_timeout (see booking.gateway).
+PAYMENT_GATEWAY_OPTIONS = {}
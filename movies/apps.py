@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from bookmyseat.cache import invalidate_on_change
+        from .search import ensure_search_index
+
+        post_migrate.connect(ensure_search_index, sender=self)
+        invalidate_on_change(self.get_model('Movie'), 'movies')
@@ -0,0 +1,32 @@
+"""
+Genre and language facet counts for the movie filters.
+
+Counts are computed with one grouped query per facet over the indexed
+``genre_key``/``language_key`` columns and kept in the ``movies``
+catalogue cache namespace, so they are rebuilt after a movie changes.
+"""
+from django.db.models import Count, Max
+
+from bookmyseat.cache import cached
+
+from .models import Movie
+
+
+FACETS_CACHE_TIMEOUT = 60 * 60
+
+
+def _count(key_field, label_field):
+    rows = (
+        Movie.objects.exclude(**{key_field: ''})
+        .values(key_field)
+        .annotate(label=Max(label_field), count=Count('id'))
+        .order_by(key_field)
+    )
+    return [{'key': row[key_field], 'label': row['label'].strip(), 'count': row['count']} for row in rows]
+
+
+def facet_counts():
+    return cached(('movies',), 'facets', lambda: {
+        'genre': _count('genre_key', 'genre'),
+        'language': _count('language_key', 'language'),
+    }, FACETS_CACHE_TIMEOUT)
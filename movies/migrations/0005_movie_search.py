@@ -0,0 +1,71 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'movies_movie_fts'
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, "cast", description,
+        content='movies_movie', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, "cast", description)
+        VALUES (new.id, new.name, new."cast", new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, "cast", description)
+        VALUES ('delete', old.id, old.name, old."cast", old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, "cast", description ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, "cast", description)
+        VALUES ('delete', old.id, old.name, old."cast", old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, "cast", description)
+        VALUES (new.id, new.name, new."cast", new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_SETUP = [
+    """ALTER TABLE movies_movie ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce("cast", '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX movies_movie_search_vector_gin ON movies_movie USING GIN (search_vector)",
+]
+
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS movies_movie_search_vector_gin",
+    "ALTER TABLE movies_movie DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_SETUP, 'postgresql': POSTGRES_SETUP}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_TEARDOWN, 'postgresql': POSTGRES_TEARDOWN}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_movie_trailer_url'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
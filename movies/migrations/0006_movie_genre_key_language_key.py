@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:24
+
+from django.db import migrations, models
+
+
+def fill_facet_keys(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    movies = list(Movie.objects.only('id', 'genre', 'language'))
+    for movie in movies:
+        movie.genre_key = (movie.genre or '').strip().lower()
+        movie.language_key = (movie.language or '').strip().lower()
+    Movie.objects.bulk_update(movies, ['genre_key', 'language_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movie_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='genre_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='language_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_facet_keys, migrations.RunPython.noop),
+    ]
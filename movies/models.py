@@ -1,5 +1,10 @@
 from django.db import models
 
+
+def normalize_facet(value):
+    return (value or '').strip().lower()
+
+
 class Movie(models.Model):
     name = models.CharField(max_length=255)
     image = models.ImageField(upload_to="movies/")
@@ -9,9 +14,20 @@ class Movie(models.Model):
     genre = models.CharField(max_length=50)
     language = models.CharField(max_length=50)
     trailer_url = models.URLField(blank=True, null=True, help_text="YouTube trailer URL (e.g., https://www.youtube.com/watch?v=xxxxx)")
+    # Normalised copies of genre/language for indexed case-insensitive filtering.
+    genre_key = models.CharField(max_length=50, db_index=True, editable=False, default='')
+    language_key = models.CharField(max_length=50, db_index=True, editable=False, default='')
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        self.genre_key = normalize_facet(self.genre)
+        self.language_key = normalize_facet(self.language)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'genre_key', 'language_key'}
+        super().save(*args, **kwargs)
     
     @property
     def trailer_embed_url(self):
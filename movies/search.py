@@ -0,0 +1,110 @@
+"""
+Ranked full-text movie search.
+
+Each movie's name, cast and description form its search document. On
+SQLite it lives in the ``movies_movie_fts`` FTS5 table, an external
+content index over ``movies_movie`` kept in sync by triggers; on
+PostgreSQL it is the generated ``search_vector`` column with a GIN
+index. Both are created by migration ``0005_movie_search``; because
+SQLite drops a table's triggers whenever a migration rebuilds it, they
+are also re-created from ``SQLITE_SETUP`` after every ``migrate``. Every term
+matches as a prefix, so partial words typed into the search box already
+find results. Name matches outrank cast matches, which outrank
+description matches.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'movies_movie_fts'
+MAX_TERMS = 8
+
+# Relative weight of name, cast and description matches.
+SQLITE_WEIGHTS = (10.0, 4.0, 1.0)
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, "cast", description,
+        content='movies_movie', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, "cast", description)
+        VALUES (new.id, new.name, new."cast", new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, "cast", description)
+        VALUES ('delete', old.id, old.name, old."cast", old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, "cast", description ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, "cast", description)
+        VALUES ('delete', old.id, old.name, old."cast", old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, "cast", description)
+        VALUES (new.id, new.name, new."cast", new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def search_movies(movies, query):
+    """Filter ``movies`` to those matching ``query``, best matches first."""
+    terms = search_terms(query)
+    if not terms:
+        return movies.none()
+
+    if connection.vendor == 'sqlite':
+        expression = ' '.join(f'"{term}"*' for term in terms)
+        matches = RawSQL(
+            f"movies_movie.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)",
+            [expression], output_field=BooleanField(),
+        )
+        # bm25() is lower for better matches.
+        rank = RawSQL(
+            f"(SELECT -bm25({FTS_TABLE}, %s, %s, %s) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = movies_movie.id)",
+            [*SQLITE_WEIGHTS, expression], output_field=FloatField(),
+        )
+    elif connection.vendor == 'postgresql':
+        expression = ' & '.join(f"{term}:*" for term in terms)
+        matches = RawSQL(
+            "movies_movie.search_vector @@ to_tsquery('simple', %s)",
+            [expression], output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            "ts_rank(movies_movie.search_vector, to_tsquery('simple', %s))",
+            [expression], output_field=FloatField(),
+        )
+    else:
+        # No ranking here, but callers order and paginate by search_rank.
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(cast__icontains=term)
+        matches, rank = condition, Value(0.0, output_field=FloatField())
+
+    return movies.filter(matches).annotate(search_rank=rank).order_by('-search_rank', 'id')
+
+
+def ensure_search_index(using='default', **kwargs):
+    # post_migrate handler: restore triggers lost to a SQLite table rebuild.
+    from django.db import connections
+
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f"{FTS_TABLE}_a%"],
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+        for sql in SQLITE_SETUP:
+            cursor.execute(sql)
+
@@ -1,39 +1,63 @@
+import hashlib
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
-from django.db.models import Q
-from .models import Movie
-from booking.models import Show
+from django.http import Http404
+from bookmyseat.cache import cache_anonymous_page, cached
+from bookmyseat.pagination import InvalidCursor, keyset_paginate, page_links
+from .facets import facet_counts
+from .models import Movie, normalize_facet
+from .search import search_movies
+from booking.showtimes import movie_showtimes, showtimes_timeout
+
+MOVIES_PER_PAGE = 24
+
 
+@cache_anonymous_page('movies')
 def movie_list(request):
     movies = Movie.objects.all()
+    ordering = ('id',)
     
     search_query = request.GET.get('search', '')
     if search_query:
-        movies = movies.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(cast__icontains=search_query)
-        )
+        movies = search_movies(movies, search_query)
+        ordering = ('-search_rank', 'id')
     
-    genre = request.GET.get('genre', '')
+    genre = normalize_facet(request.GET.get('genre', ''))
     if genre:
-        movies = movies.filter(genre__iexact=genre)
+        movies = movies.filter(genre_key=genre)
     
-    language = request.GET.get('language', '')
+    language = normalize_facet(request.GET.get('language', ''))
     if language:
-        movies = movies.filter(language__iexact=language)
+        movies = movies.filter(language_key=language)
+
+    def build_page():
+        try:
+            return keyset_paginate(movies, ordering, request.GET.get('cursor'), MOVIES_PER_PAGE)
+        except InvalidCursor:
+            return keyset_paginate(movies, ordering, None, MOVIES_PER_PAGE)
+
+    params = f"{search_query}|{genre}|{language}|{request.GET.get('cursor', '')}"
+    page = cached(('movies',), f"list:{hashlib.md5(params.encode()).hexdigest()}", build_page)
     
     return render(request, 'movies/movie_list.html', {
-        'movies': movies
+        'movies': page,
+        'page': page,
+        'facets': facet_counts(),
+        'selected_genre': genre,
+        'selected_language': language,
+        **page_links(request, page),
     })
 
 
+@cache_anonymous_page('movies', 'showtimes', timeout=showtimes_timeout())
 def movie_detail(request, movie_id):
-    movie = get_object_or_404(Movie, id=movie_id)
-    shows = Show.objects.filter(movie=movie)
+    movie = cached(('movies',), f"detail:{movie_id}", lambda: Movie.objects.filter(id=movie_id).first())
+    if movie is None:
+        raise Http404("No Movie matches the given query.")
 
     return render(request, 'movies/movie_detail.html', {
         'movie': movie,
-        'shows': shows
+        'showtimes': movie_showtimes(movie.id),
     })
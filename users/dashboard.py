@@ -0,0 +1,201 @@
+"""
+Queries behind the staff dashboard.
+
+Sales figures come from the daily rollups (see ``booking.rollups``), each
+panel in a single query: every KPI is a conditional aggregate over
+``DailySales``, so the whole page costs a fixed number of queries however
+many bookings there are. ``booking_kpis`` computes the same KPIs straight
+from ``Booking`` to cross-check the rollups; its ticket counts come from a
+per-booking subquery rather than a join, which would repeat each booking
+once per seat.
+
+Staff pages are served from a snapshot of ``dashboard_context`` kept in
+the default cache. A background thread in each worker rebuilds it every
+``DASHBOARD_REFRESH_SECONDS``; a lock in the cache makes sure only one
+worker rebuilds at a time. Without that thread (``BACKGROUND_THREADS`` or
+``DASHBOARD_BACKGROUND_REFRESH`` off) the first request to find the
+snapshot stale rebuilds it.
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from booking.models import Booking, DailyMovieSales, DailySales, DailyTheatreSales, Show
+from booking.rollups import ticket_count
+
+
+logger = logging.getLogger(__name__)
+
+TREND_DAYS = 30
+SNAPSHOT_KEY = 'dashboard:snapshot'
+REFRESH_LOCK_KEY = 'dashboard:snapshot:lock'
+REFRESH_LOCK_TIMEOUT = 120
+
+
+def _finish(kpis):
+    kpis = {key: value or 0 for key, value in kpis.items()}
+    kpis['avg_tickets_per_booking'] = (
+        kpis['total_tickets_sold'] / kpis['total_bookings'] if kpis['total_bookings'] else 0
+    )
+    return kpis
+
+
+def sales_kpis(today):
+    since = today - timedelta(days=TREND_DAYS)
+    return _finish(DailySales.objects.aggregate(
+        total_revenue=Sum('revenue'),
+        today_revenue=Sum('revenue', filter=Q(date=today)),
+        last_30_days_revenue=Sum('revenue', filter=Q(date__gte=since)),
+        total_bookings=Sum('bookings'),
+        total_tickets_sold=Sum('tickets_sold'),
+        pending_bookings=Sum(F('created') - F('bookings') - F('failed')),
+        failed_bookings=Sum('failed'),
+    ))
+
+
+def booking_kpis(today):
+    since = today - timedelta(days=TREND_DAYS)
+    confirmed = Q(status='CONFIRMED')
+    return _finish(Booking.objects.annotate(tickets=ticket_count()).aggregate(
+        total_revenue=Sum('total_amount', filter=confirmed),
+        today_revenue=Sum('total_amount', filter=confirmed & Q(created_at__date=today)),
+        last_30_days_revenue=Sum('total_amount', filter=confirmed & Q(created_at__date__gte=since)),
+        total_bookings=Count('id', filter=confirmed),
+        total_tickets_sold=Sum('tickets', filter=confirmed),
+        pending_bookings=Count('id', filter=Q(status='PENDING')),
+        failed_bookings=Count('id', filter=Q(status__in=('FAILED', 'REFUND'))),
+    ))
+
+
+def user_kpis(today):
+    return User.objects.aggregate(
+        total_users=Count('id', filter=Q(is_active=True)),
+        new_users_today=Count('id', filter=Q(date_joined__date=today)),
+    )
+
+
+def _top(rollups, *fields, limit=10):
+    return list(
+        rollups.values(*fields)
+        .annotate(total_bookings=Sum('bookings'), total_revenue=Sum('revenue'), tickets_sold=Sum('tickets_sold'))
+        .order_by('-total_bookings', fields[0])[:limit]
+    )
+
+
+def popular_movies(limit=10):
+    return _top(DailyMovieSales.objects.all(), 'movie__id', 'movie__name', 'movie__image', limit=limit)
+
+
+def busiest_theatres(limit=10):
+    return _top(DailyTheatreSales.objects.all(), 'theatre__id', 'theatre__name', 'theatre__city', limit=limit)
+
+
+def revenue_by_date(today):
+    return list(
+        DailySales.objects.filter(date__gte=today - timedelta(days=TREND_DAYS), bookings__gt=0)
+        .values('date', 'revenue').order_by('date')
+    )
+
+
+def recent_bookings(limit=20):
+    return list(
+        Booking.objects.select_related('user', 'show__movie', 'show__screen__theatre').order_by('-created_at')[:limit]
+    )
+
+
+def low_stock_shows(today, limit=10):
+    return list(
+        Show.objects.filter(date__gte=today, seats_available__lt=20)
+        .select_related('movie', 'screen__theatre').order_by('seats_available', 'date')[:limit]
+    )
+
+
+def dashboard_context(today=None):
+    """Everything ``admin/dashboard.html`` shows, in a fixed seven queries."""
+    today = today or timezone.localdate()
+    return {
+        **sales_kpis(today),
+        **user_kpis(today),
+        'popular_movies': popular_movies(),
+        'busiest_theaters': busiest_theatres(),
+        'revenue_by_date': revenue_by_date(today),
+        'recent_bookings': recent_bookings(),
+        'low_stock_shows': low_stock_shows(today),
+    }
+
+
+def refresh_interval():
+    return getattr(settings, 'DASHBOARD_REFRESH_SECONDS', 60)
+
+
+def refresh_snapshot():
+    """Rebuild the snapshot, or return ``None`` if another worker is already at it."""
+    token = uuid.uuid4().hex
+    if not cache.add(REFRESH_LOCK_KEY, token, REFRESH_LOCK_TIMEOUT):
+        return None
+    try:
+        snapshot = {'built_at': timezone.now(), 'context': dashboard_context()}
+        cache.set(SNAPSHOT_KEY, snapshot, None)
+        return snapshot
+    finally:
+        if cache.get(REFRESH_LOCK_KEY) == token:
+            cache.delete(REFRESH_LOCK_KEY)
+
+
+def snapshot_age(snapshot):
+    return (timezone.now() - snapshot['built_at']).total_seconds()
+
+
+def background_refresh():
+    return getattr(settings, 'DASHBOARD_BACKGROUND_REFRESH', True) and getattr(settings, 'BACKGROUND_THREADS', True)
+
+
+def get_snapshot():
+    start_refresher()
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        # Nothing to serve yet; build one, without caching it if someone
+        # else is already doing so.
+        snapshot = refresh_snapshot() or {'built_at': timezone.now(), 'context': dashboard_context()}
+    elif not background_refresh() and snapshot_age(snapshot) >= refresh_interval():
+        snapshot = refresh_snapshot() or snapshot
+    return snapshot
+
+
+def _refresh_forever():
+    while True:
+        wait = refresh_interval()
+        try:
+            snapshot = cache.get(SNAPSHOT_KEY)
+            age = snapshot_age(snapshot) if snapshot else wait
+            if age >= wait:
+                refresh_snapshot()
+            else:
+                wait -= age
+        except Exception as e:
+            logger.error(f"Dashboard snapshot refresh failed: {e}")
+        finally:
+            close_old_connections()
+        time.sleep(max(wait, 1))
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start_refresher():
+    global _refresher
+    if _refresher is None and background_refresh():
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = threading.Thread(target=_refresh_forever, name='dashboard-refresh', daemon=True)
+                _refresher.start()
@@ -0,0 +1,132 @@
+"""
+Streaming booking and sales exports for finance.
+
+Rows are read with ``iterator(chunk_size=EXPORT_CHUNK_SIZE)``: bookings
+come with their show, movie, theatre and user joined in, and each chunk's
+seats are fetched with one extra query. Each row is written out as soon
+as it is read, so memory stays flat however many rows are exported.
+"""
+import csv
+import json
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from booking.models import Booking, DailySales, ShowSeat
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+BOOKING_COLUMNS = [
+    'id', 'reference', 'created_at', 'status', 'username', 'email',
+    'movie', 'theatre', 'city', 'show_date', 'show_time',
+    'seats', 'tickets', 'total_amount', 'payment_id',
+]
+SALES_COLUMNS = ['date', 'created', 'bookings', 'failed', 'tickets_sold', 'revenue']
+
+# Text cells starting with one of these are read as formulas by spreadsheets.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a YYYY-MM-DD date")
+
+
+def _id(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError(f"{name} must be an id")
+    return int(value)
+
+
+def filter_bookings(params):
+    """Bookings matching the ``from``/``to``/``status``/``movie``/``theatre`` query parameters."""
+    bookings = Booking.objects.all()
+    start, end = _date(params, 'from'), _date(params, 'to')
+    if start:
+        bookings = bookings.filter(created_at__date__gte=start)
+    if end:
+        bookings = bookings.filter(created_at__date__lte=end)
+
+    status = params.get('status', '').upper()
+    if status:
+        if status not in dict(Booking.STATUS_CHOICES):
+            raise ValueError("status must be one of " + ", ".join(dict(Booking.STATUS_CHOICES)))
+        bookings = bookings.filter(status=status)
+
+    movie, theatre = _id(params, 'movie'), _id(params, 'theatre')
+    if movie:
+        bookings = bookings.filter(show__movie_id=movie)
+    if theatre:
+        bookings = bookings.filter(show__screen__theatre_id=theatre)
+    return bookings
+
+
+def booking_rows(bookings):
+    bookings = (
+        bookings.select_related('user', 'show__movie', 'show__screen__theatre')
+        .prefetch_related(Prefetch('seats', ShowSeat.objects.order_by('row', 'number')))
+        .order_by('id')
+    )
+    for booking in bookings.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        show = booking.show
+        seats = [str(seat) for seat in booking.seats.all()]
+        yield {
+            'id': booking.id,
+            'reference': booking.ticket_reference,
+            'created_at': booking.created_at,
+            'status': booking.status,
+            'username': booking.user.username,
+            'email': booking.user.email,
+            'movie': show.movie.name,
+            'theatre': show.screen.theatre.name,
+            'city': show.screen.theatre.city,
+            'show_date': show.date,
+            'show_time': show.time,
+            'seats': " ".join(seats),
+            'tickets': len(seats),
+            'total_amount': booking.total_amount,
+            'payment_id': booking.razorpay_payment_id or '',
+        }
+
+
+def sales_rows(params):
+    sales = DailySales.objects.order_by('date')
+    start, end = _date(params, 'from'), _date(params, 'to')
+    if start:
+        sales = sales.filter(date__gte=start)
+    if end:
+        sales = sales.filter(date__lte=end)
+    return sales.values(*SALES_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows, columns):
+    writer = csv.DictWriter(_Echo(), columns)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow({key: _cell(value) for key, value in row.items()})
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,90 @@
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from booking.models import Booking, Screen, Show, ShowSeat, Theatre
+from booking.rollups import rebuild_rollups
+from movies.models import Movie
+from users.dashboard import booking_kpis, dashboard_context, sales_kpis
+
+class Command(BaseCommand):
+    help = "Time the staff dashboard queries against a synthetic booking history (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.populate(options['bookings'], options['days'])
+            self.measure(options['repeat'])
+            transaction.set_rollback(True)
+
+    def timed(self, label, func, repeat=1):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                result = func()
+            elapsed = (time.perf_counter() - started) / repeat
+        self.stdout.write(f"{label}: {elapsed * 1000:.2f} ms, {len(queries) // repeat} queries")
+        return result
+
+    def populate(self, count, days):
+        rng = random.Random(0)
+        started = time.perf_counter()
+        users = User.objects.bulk_create(User(username=f"bench-{i}") for i in range(100))
+        movies = Movie.objects.bulk_create(Movie(name=f"Bench {i}", rating=3, cast="Cast") for i in range(20))
+        theatres = Theatre.objects.bulk_create(Theatre(name=f"Bench {i}", city="Bench", address="-") for i in range(10))
+        screens = Screen.objects.bulk_create(Screen(theatre=t, screen_number=1, total_seats=300) for t in theatres)
+        shows = Show.objects.bulk_create(
+            Show(movie=rng.choice(movies), screen=rng.choice(screens), date=timezone.localdate(), time=dt_time(18, 0), price=200)
+            for _ in range(100)
+        )
+
+        today = timezone.localdate()
+        per_day = max(count // days, 1)
+        through = Booking.seats.through
+        for day in range(days):
+            day_bookings = []
+            for _ in range(per_day):
+                show = rng.choice(shows)
+                seats = rng.randint(1, 4)
+                day_bookings.append((show, seats, Booking(
+                    user=rng.choice(users), show=show, total_amount=seats * show.price,
+                    status=rng.choices(['CONFIRMED', 'PENDING', 'FAILED'], [8, 1, 1])[0],
+                )))
+            created = Booking.objects.bulk_create(b for _, _, b in day_bookings)
+            Booking.objects.filter(id__in=[b.id for b in created]).update(
+                created_at=timezone.make_aware(datetime.combine(today - timedelta(days=day), dt_time(12, 0)))
+            )
+            seats = ShowSeat.objects.bulk_create(
+                ShowSeat(show=show, row="A", number=n, is_booked=True)
+                for show, n_seats, _ in day_bookings for n in range(n_seats)
+            )
+            links, seats = [], iter(seats)
+            for _, n_seats, booking in day_bookings:
+                links.extend(through(booking_id=booking.id, showseat_id=next(seats).id) for _ in range(n_seats))
+            through.objects.bulk_create(links)
+
+        self.stdout.write(
+            f"Created {per_day * days} bookings over {days} days in {time.perf_counter() - started:.1f}s"
+        )
+
+    def measure(self, repeat):
+        today = timezone.localdate()
+        self.timed("Backfill rollups", rebuild_rollups)
+        live = self.timed("KPIs from bookings", lambda: booking_kpis(today))
+        rolled = self.timed("KPIs from rollups", lambda: sales_kpis(today), repeat)
+        self.timed("Whole dashboard", dashboard_context, repeat)
+
+        if live == rolled:
+            self.stdout.write(self.style.SUCCESS("Rollup KPIs match the bookings"))
+        else:
+            self.stdout.write(self.style.ERROR(f"Rollup KPIs differ: {rolled} != {live}"))
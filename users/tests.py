@@ -1 +1,127 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.utils import timezone
+
+from booking.models import Booking, ShowSeat
+from booking.tests import ShowTestCase
+
+
+class StaffDashboardTestCase(ShowTestCase):
+    """A staff member, logged in, with a pending two-seat booking for the show."""
+
+    def setUp(self):
+        import tempfile
+        from django.core.cache import cache
+        self.enterContext(override_settings(TICKET_IMAGE_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.enterContext(override_settings(DASHBOARD_BACKGROUND_REFRESH=False))
+        cache.clear()
+        self.user = User.objects.create_user(username='staff', email='staff@example.com', password='testpass123', is_staff=True)
+        seat_ids = [ShowSeat.objects.create(show=self.show, row="A", number=n).id for n in (1, 2)]
+        ShowSeat.objects.claim(self.show, seat_ids, self.user)
+        self.booking = Booking.objects.create(
+            user=self.user, show=self.show, total_amount=400, razorpay_order_id='order_fake123'
+        )
+        self.booking.seats.set(seat_ids)
+        self.client.force_login(self.user)
+
+    def _confirm(self):
+        from booking.views import confirm_booking
+        self.assertTrue(confirm_booking(self.booking, 'pay_1'))
+
+
+class DashboardQueryTestCase(StaffDashboardTestCase):
+    def test_dashboard_queries_stay_within_budget(self):
+        from booking.rollups import rebuild_rollups
+        from users.dashboard import booking_kpis, dashboard_context, sales_kpis
+
+        self._confirm()
+        with self.assertNumQueries(7):
+            dashboard_context()
+
+        for n in range(3, 8):
+            seat = ShowSeat.objects.create(show=self.show, row="B", number=n, is_booked=True)
+            booking = Booking.objects.create(user=self.user, show=self.show, total_amount=200, status='CONFIRMED')
+            booking.seats.add(seat)
+        rebuild_rollups()
+
+        with self.assertNumQueries(7):
+            context = dashboard_context()
+        self.assertEqual(context['total_tickets_sold'], 7)
+        self.assertEqual(sales_kpis(timezone.localdate()), booking_kpis(timezone.localdate()))
+
+    def test_benchmark_rolls_back_and_checks_kpis(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('benchmark_dashboard', bookings=20, days=2, repeat=1, stdout=out)
+        self.assertIn("Rollup KPIs match the bookings", out.getvalue())
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class DashboardSnapshotTestCase(StaffDashboardTestCase):
+    def test_dashboard_is_served_from_a_snapshot_until_refreshed(self):
+        from django.core.cache import cache
+        from users.dashboard import REFRESH_LOCK_KEY, refresh_snapshot
+
+        self.assertEqual(self.client.get('/dashboard/').context['total_tickets_sold'], 0)
+
+        self._confirm()
+        response = self.client.get('/dashboard/')
+        self.assertEqual(response.context['total_tickets_sold'], 0)
+        self.assertContains(response, "Refresh now")
+
+        # Single flight: nothing is rebuilt while another worker holds the lock.
+        cache.add(REFRESH_LOCK_KEY, 'elsewhere')
+        self.assertIsNone(refresh_snapshot())
+        cache.delete(REFRESH_LOCK_KEY)
+
+        response = self.client.post('/dashboard/refresh/')
+        self.assertRedirects(response, '/dashboard/')
+        self.assertEqual(self.client.get('/dashboard/').context['total_tickets_sold'], 2)
+
+    @override_settings(DASHBOARD_BACKGROUND_REFRESH=True, BACKGROUND_THREADS=False, DASHBOARD_REFRESH_SECONDS=60)
+    def test_stale_snapshot_is_rebuilt_on_request_without_background_threads(self):
+        self.assertEqual(self.client.get('/dashboard/').context['total_tickets_sold'], 0)
+        self._confirm()
+        self.assertEqual(self.client.get('/dashboard/').context['total_tickets_sold'], 0)
+        with override_settings(DASHBOARD_REFRESH_SECONDS=0):
+            self.assertEqual(self.client.get('/dashboard/').context['total_tickets_sold'], 2)
+
+
+class ExportTestCase(StaffDashboardTestCase):
+    def test_booking_export_streams_filtered_rows(self):
+        import csv
+        import json
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self._confirm()
+        for _ in range(3):
+            Booking.objects.create(user=self.user, show=self.show, total_amount=200, status='FAILED')
+
+        response = self.client.get('/dashboard/export/bookings.csv', {'status': 'confirmed', 'movie': self.movie.id})
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(csv.DictReader(b"".join(response.streaming_content).decode().splitlines()))
+        # One query for the bookings and one for their seats.
+        self.assertEqual(len(ctx), 2)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['reference'], rows[0]['seats'], rows[0]['tickets']), (self.booking.ticket_reference, "A1 A2", "2"))
+
+        response = self.client.get('/dashboard/export/bookings.ndjson', {'theatre': self.theatre.id})
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([line['status'] for line in lines], ['CONFIRMED', 'FAILED', 'FAILED', 'FAILED'])
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        self.assertEqual(self.client.get('/dashboard/export/bookings.csv', {'from': 'yesterday'}).status_code, 400)
+
+    def test_csv_export_escapes_formulas(self):
+        import csv
+        from users.exports import stream_csv
+
+        rows = [{'username': '=HYPERLINK("http://evil")', 'email': '@x', 'tickets': -1, 'movie': 'Up'}]
+        lines = "".join(stream_csv(rows, ['username', 'email', 'tickets', 'movie'])).splitlines()
+        self.assertEqual(list(csv.DictReader(lines))[0], {
+            'username': '\'=HYPERLINK("http://evil")', 'email': "'@x", 'tickets': '-1', 'movie': 'Up',
+        })
@@ -1,6 +1,6 @@
-from django.urls import path
+from django.urls import path, re_path
 from .views import register, login_view, profile, reset_password, home
-from .admin_views import admin_dashboard
+from .admin_views import admin_dashboard, refresh_dashboard, export_bookings, export_sales
 from django.contrib.auth import views as auth_views
 
 class CustomLogoutView(auth_views.LogoutView):
@@ -27,4 +27,7 @@ urlpatterns = [
          auth_views.PasswordResetCompleteView.as_view(template_name='users/password_reset_complete.html'),
          name='password_reset_complete'),
     path('dashboard/', admin_dashboard, name='admin_dashboard'),
+    path('dashboard/refresh/', refresh_dashboard, name='refresh_dashboard'),
+    re_path(r'^dashboard/export/bookings\.(?P<fmt>csv|ndjson)$', export_bookings, name='export_bookings'),
+    re_path(r'^dashboard/export/sales\.(?P<fmt>csv|ndjson)$', export_sales, name='export_sales'),
 ]
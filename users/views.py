@@ -1,15 +1,30 @@
+import hashlib
+
 from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
 from .forms import UserRegisterForm, UserUpdateForm
 from django.shortcuts import render,redirect
 from django.contrib.auth import login,authenticate
 from django.contrib.auth.decorators import login_required
+from bookmyseat.cache import cache_anonymous_page, cached
+from bookmyseat.pagination import InvalidCursor, keyset_paginate, page_links
 from movies.models import Movie
-from booking.models import Booking
+from booking.history import past_bookings, upcoming_bookings
+
+HOME_MOVIES_PER_PAGE = 4
+
+
+def _home_page(cursor):
+    try:
+        return keyset_paginate(Movie.objects.all(), ('id',), cursor, HOME_MOVIES_PER_PAGE)
+    except InvalidCursor:
+        return keyset_paginate(Movie.objects.all(), ('id',), None, HOME_MOVIES_PER_PAGE)
 
 
+@cache_anonymous_page('movies')
 def home(request):
-    movies= Movie.objects.all()
-    return render(request,'home.html',{'movies':movies})
+    cursor = request.GET.get('cursor', '')
+    page = cached(('movies',), f"home:{hashlib.md5(cursor.encode()).hexdigest()}", lambda: _home_page(cursor))
+    return render(request,'home.html',{'movies':page,'page':page,**page_links(request,page)})
 def register(request):
     if request.method == 'POST':
         form=UserRegisterForm(request.POST)
@@ -37,7 +52,6 @@ def login_view(request):
 
 @login_required
 def profile(request):
-    bookings= Booking.objects.filter(user=request.user)
     if request.method == 'POST':
         u_form = UserUpdateForm(request.POST, instance=request.user)
         if u_form.is_valid():
@@ -46,7 +60,14 @@ def profile(request):
     else:
         u_form = UserUpdateForm(instance=request.user)
 
-    return render(request, 'users/profile.html', {'u_form': u_form,'bookings':bookings})
+    page = past_bookings(request.user, request.GET.get('cursor'))
+    return render(request, 'users/profile.html', {
+        'u_form': u_form,
+        'upcoming_bookings': upcoming_bookings(request.user),
+        'bookings': page,
+        'page': page,
+        **page_links(request, page),
+    })
 
 @login_required
 def reset_password(request):